@@ -2,10 +2,18 @@
 This module is responsible for generating time series data based on the specified parameters.
 """
 
+import json
+import os
 import pickle
+from multiprocessing import Pool
 import numpy as np
 import networkx as nx
-from d2c.data_generation.models import model_registry
+from d2c.data_generation.models import (
+    model_registry,
+    neighbor_matrix,
+    stacked_neighbor_matrix,
+)
+from d2c.data_generation.store import ShardWriter, read_shards
 
 
 class TSBuilder:
@@ -19,7 +27,7 @@ class TSBuilder:
         neighbors (dict): Dictionary to store generated neighbors.
 
     Methods:
-        __init__(self, observations_per_time_series=200, maxlags=4, n_variables=5, time_series_per_process=10, processes_to_use=list(range(1, 21)), noise_std=0.1, max_neighborhood_size=6, seed=42, max_attempts=20, verbose=True):
+        __init__(self, observations_per_time_series=200, maxlags=4, n_variables=5, time_series_per_process=10, processes_to_use=list(range(1, 21)), noise_std=0.1, max_neighborhood_size=6, seed=42, max_attempts=20, vectorized=True, batched=False, lazy=False, n_jobs=1, compiled=False, output_dir=None, shard_size=1000, verbose=True):
 
         build(self):
 
@@ -30,6 +38,8 @@ class TSBuilder:
         get_neighbors(self):
 
         to_pickle(self, path):
+
+        from_store(cls, path):
     """
 
     def __init__(
@@ -43,6 +53,13 @@ class TSBuilder:
         max_neighborhood_size: int = 6,
         seed: int = 42,
         max_attempts: int = 20,
+        vectorized: bool = True,
+        batched: bool = False,
+        lazy: bool = False,
+        n_jobs: int = 1,
+        compiled: bool = False,
+        output_dir: str = None,
+        shard_size: int = 1000,
         verbose: bool = True,
     ):
         """
@@ -57,6 +74,21 @@ class TSBuilder:
             noise_std (float): Standard deviation of the noise.
             max_neighborhood_size (int): Maximum size of the neighborhood.
             seed (int): Seed for random number generation.
+            max_attempts (int): Maximum number of attempts to generate a valid time series.
+            vectorized (bool): Whether to update all the variables of a time step at once with the models' `step` functions.
+                The output is bit-identical to the variable-by-variable `update` loop.
+            batched (bool): Whether to simulate all the attempts of all the time series of a process at once, as one (series, time, variables) array.
+                The random draws are the same, so the output is identical to the sequential build.
+            lazy (bool): Whether to stop at the first valid attempt of each time series, aborting attempts as soon as they diverge.
+                Each attempt draws from its own `np.random.Generator` seeded from (seed, process, time series, attempt),
+                so the output is reproducible but differs from the non-lazy builds.
+            n_jobs (int): Number of worker processes. With n_jobs != 1, the (process, time series) couples are generated
+                in parallel with the random streams of the lazy mode, so the output is the same as with lazy=True, whatever the number of workers.
+            compiled (bool): Whether to run each attempt with the model's compiled recurrence (see d2c.data_generation.kernels), when numba is available.
+                Falls back to the Python path otherwise. The compiled output matches the Python one up to floating-point rounding.
+            output_dir (str): Directory of an on-disk store (see d2c.data_generation.store) to stream the time series to, instead of keeping them in memory.
+                If the store already holds shards, the build resumes after the last one. Read it back with `TSBuilder.from_store`.
+            shard_size (int): Number of time series per shard of the store.
             verbose (bool): Whether to print verbose output.
         """
         self.observations_per_time_series = observations_per_time_series
@@ -66,6 +98,13 @@ class TSBuilder:
         self.noise_std = noise_std
         self.seed = seed
         self.max_attempts = max_attempts
+        self.vectorized = vectorized
+        self.batched = batched
+        self.lazy = lazy
+        self.n_jobs = n_jobs
+        self.compiled = compiled
+        self.output_dir = output_dir
+        self.shard_size = shard_size
 
         if processes_to_use is None:
             self.processes_to_use = list(range(1, 21))
@@ -78,21 +117,56 @@ class TSBuilder:
         self.generated_dags = {}
         self.neighbors = {}
 
+        self._writer = None
+        self._done = set()
+
         self.verbose = verbose
 
+    def __getstate__(self):
+        # the workers of the parallel build only need the parameters, not the results gathered so far
+        state = self.__dict__.copy()
+        state.update(
+            generated_observations={}, generated_dags={}, neighbors={}, _writer=None
+        )
+        return state
+
     def build(self):
         """
         Builds the time series data.
 
-        Args:
-            max_attempts (int): Maximum number of attempts to generate valid time series.
-
         Raises:
-            ValueError: If a non-finite value is detected in the generated time series.
+            ValueError: If no valid time series is generated within max_attempts attempts.
 
         """
         np.random.seed(self.seed)
+        if self.output_dir is not None:
+            self._writer = ShardWriter(
+                self.output_dir, self._store_metadata(), self.shard_size
+            )
+            self._done = self._writer.get_done()
+            rng_state = self._writer.get_rng_state()
+            if rng_state is not None:
+                np.random.set_state(rng_state)
+
+        if self.n_jobs != 1:
+            self._build_parallel()
+        else:
+            self._build_processes()
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _build_processes(self):
+        """
+        Generates the processes one after the other, skipping the ones already in the store.
+        """
         for process_id in self.processes_to_use:
+            if all(
+                (process_id, ts_index) in self._done
+                for ts_index in range(self.ts_per_process)
+            ):
+                continue
 
             if self.verbose:
                 print(f"Generating data for process {process_id}...")
@@ -111,81 +185,482 @@ class TSBuilder:
             # for this reason, we take max_time_lag + 1
             total_ts_lines = self.observations_per_time_series + lines_to_initialize
 
+            if self.lazy:
+                self._build_process_lazy(
+                    process_id, model_instance, total_ts_lines, lines_to_initialize
+                )
+            elif self.batched:
+                self._build_process_batched(
+                    process_id, model_instance, total_ts_lines, lines_to_initialize
+                )
+            else:
+                self._build_process(
+                    process_id, model_instance, total_ts_lines, lines_to_initialize
+                )
+
+    def _build_process(
+        self, process_id, model_instance, total_ts_lines, lines_to_initialize
+    ):
+        """
+        Generates the time series of a process one by one, running all the attempts of each of them.
+        """
+        for ts_index in range(self.ts_per_process):
+            if (process_id, ts_index) in self._done:
+                continue
+            if self.verbose:
+                print(f"{ts_index + 1 }/{self.ts_per_process}", end="\r")
+
+            attempted_series = []
+            attempted_neighbors = []
+            attempts = 0
+            while attempts < self.max_attempts:
+                Y_n, N_j, W = self._draw_attempt(total_ts_lines, lines_to_initialize)
+                self._simulate(model_instance, Y_n, N_j, W, lines_to_initialize)
+                attempted_series.append(Y_n)
+                attempted_neighbors.append(N_j)
+                attempts += 1
+
+            attempted_series = np.stack(attempted_series)
+            self._store_first_valid(
+                process_id,
+                ts_index,
+                model_instance,
+                attempted_series,
+                attempted_neighbors,
+                self._valid_mask(attempted_series),
+                lines_to_initialize,
+            )
+            self._checkpoint()
+
+    def _build_process_batched(
+        self, process_id, model_instance, total_ts_lines, lines_to_initialize
+    ):
+        """
+        Generates all the attempts of all the time series of a process in one (series, time, variables) array.
+        When streaming to a store, the time series are generated in chunks of at most `shard_size`, so that the buffer
+        is written as it fills. The draws come in the same order either way, so the chunks do not change the output.
+        """
+        first_ts = next(
+            (
+                ts_index
+                for ts_index in range(self.ts_per_process)
+                if (process_id, ts_index) not in self._done
+            ),
+            self.ts_per_process,
+        )
+        chunk_size = (
+            self.ts_per_process if self._writer is None else max(1, self.shard_size)
+        )
+        for start in range(first_ts, self.ts_per_process, chunk_size):
+            n_series = min(chunk_size, self.ts_per_process - start)
+            draws = [
+                self._draw_attempt(total_ts_lines, lines_to_initialize)
+                for _ in range(n_series * self.max_attempts)
+            ]
+            attempted_series = self._simulate_batch(
+                model_instance, draws, lines_to_initialize
+            ).reshape(n_series, self.max_attempts, total_ts_lines, self.n_variables)
+            valid = self._valid_mask(attempted_series)
+            for offset in range(n_series):
+                first_draw = offset * self.max_attempts
+                attempted_neighbors = [
+                    N_j
+                    for _, N_j, _ in draws[first_draw : first_draw + self.max_attempts]
+                ]
+                self._store_first_valid(
+                    process_id,
+                    start + offset,
+                    model_instance,
+                    attempted_series[offset],
+                    attempted_neighbors,
+                    valid[offset],
+                    lines_to_initialize,
+                )
+            # the draws of the whole chunk come first, so the random state is only consistent with the store here
+            self._checkpoint()
+
+    def _build_process_lazy(
+        self, process_id, model_instance, total_ts_lines, lines_to_initialize
+    ):
+        """
+        Generates the time series of a process attempt after attempt, stopping at the first valid one.
+        When batched, each round simulates the next attempt of all the time series still lacking a valid one.
+        """
+        if not self.batched:
             for ts_index in range(self.ts_per_process):
+                if (process_id, ts_index) in self._done:
+                    continue
                 if self.verbose:
                     print(f"{ts_index + 1 }/{self.ts_per_process}", end="\r")
-                # The seeding is here because attempts can vary across executions, likely due to floating point operations
-
-                attempted_series = []
-                attempted_neighbors = []
-                attempts = 0
-                while attempts < self.max_attempts:
+                generated = self._generate_time_series(process_id, ts_index)
+                if generated is None:
+                    raise self._generation_error(process_id, ts_index)
+                self._store(
+                    process_id,
+                    ts_index,
+                    model_instance,
+                    *generated,
+                    lines_to_initialize,
+                )
+                self._checkpoint()
+            return
+
+        pending = [
+            ts_index
+            for ts_index in range(self.ts_per_process)
+            if (process_id, ts_index) not in self._done
+        ]
+        for attempt in range(self.max_attempts):
+            if not pending:
+                break
+            if self.verbose:
+                print(f"attempt {attempt + 1}: {len(pending)} time series", end="\r")
 
-                    W = np.random.normal(
-                        0, self.noise_std, (total_ts_lines, self.n_variables)
-                    )
-                    # noise to zero
-                    # W = np.zeros((total_ts_lines, self.n_variables))
-                    size_N_j = np.random.randint(
-                        1, self.max_neighborhood_size + 1, self.n_variables
+            draws = [
+                self._draw_attempt(
+                    total_ts_lines,
+                    lines_to_initialize,
+                    rng=self._attempt_rng(process_id, ts_index, attempt),
+                )
+                for ts_index in pending
+            ]
+            attempted_series = self._simulate_batch(
+                model_instance, draws, lines_to_initialize, early_exit=True
+            )
+            valid = self._valid_mask(attempted_series)
+            for ts_index, (_, N_j, _), Y_n, is_valid in zip(
+                pending, draws, attempted_series, valid
+            ):
+                if is_valid:
+                    self._store(
+                        process_id,
+                        ts_index,
+                        model_instance,
+                        Y_n,
+                        N_j,
+                        lines_to_initialize,
                     )
+                    # the attempts have their own random streams, so any point is a valid checkpoint
+                    self._checkpoint()
+            pending = [
+                ts_index for ts_index, is_valid in zip(pending, valid) if not is_valid
+            ]
+
+        if pending:
+            raise self._generation_error(process_id, pending[0])
+
+        # the rounds store the time series out of order
+        for generated in (
+            self.generated_observations,
+            self.generated_dags,
+            self.neighbors,
+        ):
+            generated[process_id] = dict(sorted(generated[process_id].items()))
+        self._checkpoint()
+
+    def _build_parallel(self):
+        """
+        Generates all the (process, time series) couples over a pool of `n_jobs` worker processes.
+        Each couple only depends on its own random streams, so the output does not depend on the number of workers.
+        """
+        units = [
+            (process_id, ts_index)
+            for process_id in self.processes_to_use
+            for ts_index in range(self.ts_per_process)
+            if (process_id, ts_index) not in self._done
+        ]
+        if self.verbose:
+            print(f"Generating {len(units)} time series with {self.n_jobs} workers...")
+
+        model_instances = {
+            process_id: model_registry.get_model(process_id)()
+            for process_id in self.processes_to_use
+        }
+        for process_id in self.processes_to_use:
+            self.generated_observations[process_id] = {}
+            self.generated_dags[process_id] = {}
+            self.neighbors[process_id] = {}
 
-                    # fill up the neighborhood of each variable, starting from the variables itself
-                    N_j = [[j] for j in range(self.n_variables)]
-                    for j in range(self.n_variables):
-                        remaining_size = size_N_j[j] - 1
-                        remaining = np.setdiff1d(range(self.n_variables), N_j[j])
-                        if remaining_size > 0:
-                            N_j[j] = np.append(
-                                N_j[j],
-                                np.random.choice(
-                                    remaining, remaining_size, replace=False
-                                ),
-                            )
-                    Y_n = np.full((total_ts_lines, self.n_variables), np.nan)
-
-                    # Initialize the first `lines_to_initialize` rows with starting values if needed
-                    # Random
-                    Y_n[:lines_to_initialize] = np.random.uniform(
-                        -1, 1, (lines_to_initialize, self.n_variables)
-                    )
+        # the time series are stored as they come, in order
+        with Pool(processes=self.n_jobs) as pool:
+            results = pool.imap(
+                self._generate_unit,
+                units,
+                chunksize=max(1, len(units) // (4 * self.n_jobs)),
+            )
+            for (process_id, ts_index), generated in zip(units, results):
+                if generated is None:
+                    raise self._generation_error(process_id, ts_index)
+                model_instance = model_instances[process_id]
+                self._store(
+                    process_id,
+                    ts_index,
+                    model_instance,
+                    *generated,
+                    model_instance.get_maximum_time_lag() + 1,
+                )
+                self._checkpoint()
 
-                    # the update functions expect to be given the last 'available' line to compute following values
-                    # so we start from lines_to_initialize - 1 and go up to total_ts_lines - 1
-                    for t in range(lines_to_initialize - 1, total_ts_lines - 1):
-                        for j in range(self.n_variables):
-                            Y_n[t + 1, j] = model_instance.update(Y_n, t, j, N_j[j], W)
-
-                    # attempted_series.append(Y_n[max_time_lag:])
-                    attempted_series.append(Y_n)
-                    attempted_neighbors.append(N_j)
-                    attempts += 1
-
-                chosen_series = None
-                chosen_neighbors = None
-                threshold = 1e-6  # Define a threshold for extremely small numbers in absolute value
-                for series_idx, Y_n in enumerate(attempted_series):
-                    if not np.any(np.isnan(Y_n)) and not np.any(np.isinf(Y_n)):
-                        if np.min(Y_n) > -1e6 and np.max(Y_n) < 1e6:
-                            if not np.any(
-                                np.abs(Y_n) < threshold
-                            ):  # Check if all values are above the threshold
-                                chosen_series = Y_n
-                                chosen_neighbors = attempted_neighbors[series_idx]
-                                break
-
-                if chosen_series is None:
-                    raise ValueError(
-                        f"Failed to generate valid TS for model {process_id}, TS index {ts_index} after {self.max_attempts} attempts. Try again with a different seed."
-                    )
+    def _generate_unit(self, unit):
+        return self._generate_time_series(*unit)
+
+    def _generate_time_series(self, process_id, ts_index):
+        """
+        Generates one time series with the lazy strategy: attempts run one after the other, each with its own random stream,
+        and the first valid one is kept. This is the unit of work of the parallel build.
+
+        Returns:
+            tuple: The series (initialization rows included) and its neighborhoods N_j, or None if no attempt is valid.
+        """
+        model_instance = model_registry.get_model(process_id)()
+        lines_to_initialize = model_instance.get_maximum_time_lag() + 1
+        total_ts_lines = self.observations_per_time_series + lines_to_initialize
+
+        for attempt in range(self.max_attempts):
+            Y_n, N_j, W = self._draw_attempt(
+                total_ts_lines,
+                lines_to_initialize,
+                rng=self._attempt_rng(process_id, ts_index, attempt),
+            )
+            self._simulate(
+                model_instance, Y_n, N_j, W, lines_to_initialize, early_exit=True
+            )
+            if self._valid_mask(Y_n):
+                return Y_n, N_j
+        return None
 
-                self.generated_dags[process_id][ts_index] = model_instance.build_dag(
-                    T=self.maxlags, N_j=chosen_neighbors, N=self.n_variables
+    def _attempt_rng(self, process_id, ts_index, attempt):
+        """
+        Returns the random generator of one attempt, derived from the seed and the (process, time series, attempt) triple.
+        The streams are independent, so discarding an attempt does not shift the draws of the following ones.
+        """
+        return np.random.default_rng(
+            np.random.SeedSequence(self.seed, spawn_key=(process_id, ts_index, attempt))
+        )
+
+    def _store_first_valid(
+        self,
+        process_id,
+        ts_index,
+        model_instance,
+        attempted_series,
+        attempted_neighbors,
+        valid,
+        lines_to_initialize,
+    ):
+        """
+        Stores the first valid attempt of a time series.
+
+        Raises:
+            ValueError: If none of the attempts is valid.
+        """
+        if not valid.any():
+            raise self._generation_error(process_id, ts_index)
+        chosen_attempt = np.argmax(valid)  # first True
+        self._store(
+            process_id,
+            ts_index,
+            model_instance,
+            attempted_series[chosen_attempt],
+            attempted_neighbors[chosen_attempt],
+            lines_to_initialize,
+        )
+
+    def _store(
+        self,
+        process_id,
+        ts_index,
+        model_instance,
+        chosen_series,
+        chosen_neighbors,
+        lines_to_initialize,
+    ):
+        """
+        Stores a time series, without its initialization rows, together with its DAG and neighbors.
+        When streaming to a store, only the series and its neighbors are written: the DAG is rebuilt from them on reading.
+        """
+        if self._writer is not None:
+            self._writer.append(
+                process_id,
+                ts_index,
+                chosen_series[lines_to_initialize:],
+                chosen_neighbors,
+            )
+            return
+        self.generated_dags[process_id][ts_index] = model_instance.build_dag(
+            T=self.maxlags, N_j=chosen_neighbors, N=self.n_variables
+        )
+        # copy, so that the discarded attempts can be freed
+        self.generated_observations[process_id][ts_index] = chosen_series[
+            lines_to_initialize:
+        ].copy()
+        self.neighbors[process_id][ts_index] = chosen_neighbors
+
+    def _checkpoint(self):
+        """
+        Lets the store write a shard. Only called once the store holds every time series drawn from the global random state so far.
+        """
+        if self._writer is not None:
+            self._writer.checkpoint(np.random.get_state())
+
+    def _store_metadata(self):
+        """
+        Returns the parameters that determine the content of the store, as keyword arguments of TSBuilder.
+        The parallel build uses the random streams of the lazy one, so both can resume each other.
+        """
+        lazy = self.lazy or self.n_jobs != 1
+        return {
+            "observations_per_time_series": self.observations_per_time_series,
+            "maxlags": self.maxlags,
+            "n_variables": self.n_variables,
+            "time_series_per_process": self.ts_per_process,
+            "processes_to_use": [
+                int(process_id) for process_id in self.processes_to_use
+            ],
+            "noise_std": self.noise_std,
+            "max_neighborhood_size": self.max_neighborhood_size,
+            "seed": self.seed,
+            "max_attempts": self.max_attempts,
+            "batched": self.batched and not lazy,
+            "lazy": lazy,
+            "compiled": self.compiled,
+        }
+
+    def _generation_error(self, process_id, ts_index):
+        return ValueError(
+            f"Failed to generate valid TS for model {process_id}, TS index {ts_index} after {self.max_attempts} attempts. Try again with a different seed."
+        )
+
+    def _draw_attempt(self, total_ts_lines, lines_to_initialize, rng=np.random):
+        """
+        Draws the random inputs of one attempt: the noise, the neighborhoods and the initial values.
+
+        Args:
+            total_ts_lines (int): Length of the series, initialization rows included.
+            lines_to_initialize (int): Number of initial rows to draw.
+            rng (np.random.Generator): Random generator to draw from. Defaults to the global random state.
+
+        Returns:
+            tuple: The series with only the first `lines_to_initialize` rows filled, the neighborhoods N_j and the noise W.
+        """
+        randint = rng.integers if isinstance(rng, np.random.Generator) else rng.randint
+
+        W = rng.normal(0, self.noise_std, (total_ts_lines, self.n_variables))
+        # noise to zero
+        # W = np.zeros((total_ts_lines, self.n_variables))
+        size_N_j = randint(1, self.max_neighborhood_size + 1, self.n_variables)
+
+        # fill up the neighborhood of each variable, starting from the variables itself
+        N_j = [[j] for j in range(self.n_variables)]
+        for j in range(self.n_variables):
+            remaining_size = size_N_j[j] - 1
+            remaining = np.setdiff1d(range(self.n_variables), N_j[j])
+            if remaining_size > 0:
+                N_j[j] = np.append(
+                    N_j[j],
+                    rng.choice(remaining, remaining_size, replace=False),
                 )
-                self.generated_observations[process_id][ts_index] = chosen_series[
-                    lines_to_initialize:
+        Y_n = np.full((total_ts_lines, self.n_variables), np.nan)
+
+        # Initialize the first `lines_to_initialize` rows with starting values if needed
+        # Random
+        Y_n[:lines_to_initialize] = rng.uniform(
+            -1, 1, (lines_to_initialize, self.n_variables)
+        )
+        return Y_n, N_j, W
+
+    def _simulate(
+        self, model_instance, Y_n, N_j, W, lines_to_initialize, early_exit=False
+    ):
+        """
+        Runs the recurrence of the model over a single attempt, filling Y_n in place.
+        With `early_exit`, the simulation stops as soon as a value is non-finite or beyond +-1e6; the remaining rows stay NaN.
+        """
+        # the update functions expect to be given the last 'available' line to compute following values
+        # so we start from lines_to_initialize - 1 and go up to total_ts_lines - 1
+        kernel = self._kernel(model_instance)
+        if kernel is not None:
+            indices, _, sizes = neighbor_matrix(N_j)
+            kernel(Y_n, indices, sizes, W, lines_to_initialize - 1, early_exit)
+        elif self.vectorized:
+            neighbors = neighbor_matrix(N_j)
+            with np.errstate(over="ignore", invalid="ignore"):
+                for t in range(lines_to_initialize - 1, Y_n.shape[0] - 1):
+                    Y_n[t + 1] = model_instance.step(Y_n, t, neighbors, W)
+                    if early_exit and not np.all(np.abs(Y_n[t + 1]) < 1e6):
+                        break
+        else:
+            for t in range(lines_to_initialize - 1, Y_n.shape[0] - 1):
+                for j in range(self.n_variables):
+                    Y_n[t + 1, j] = model_instance.update(Y_n, t, j, N_j[j], W)
+                if early_exit and not np.all(np.abs(Y_n[t + 1]) < 1e6):
+                    break
+        return Y_n
+
+    def _simulate_batch(
+        self, model_instance, draws, lines_to_initialize, early_exit=False
+    ):
+        """
+        Runs the recurrence of the model over many attempts at once.
+        The attempts are stacked time-major, so that Y[t] holds time t of every attempt and the models' `step` functions apply unchanged.
+
+        Args:
+            model_instance (BaseModel): The generative model.
+            draws (list): The (Y_n, N_j, W) tuples returned by `_draw_attempt`.
+            lines_to_initialize (int): Number of initial rows already filled.
+            early_exit (bool): Whether to stop once every attempt has a non-finite value or a value beyond +-1e6.
+
+        Returns:
+            np.ndarray: The simulated attempts, of shape (attempts, time, variables).
+        """
+        if self._kernel(model_instance) is not None:
+            # the compiled recurrence is already a tight loop, one attempt at a time
+            return np.stack(
+                [
+                    self._simulate(
+                        model_instance, Y_n, N_j, W, lines_to_initialize, early_exit
+                    )
+                    for Y_n, N_j, W in draws
                 ]
-                self.neighbors[process_id][ts_index] = chosen_neighbors
+            )
+
+        Y = np.stack([Y_n for Y_n, _, _ in draws], axis=1)
+        W = np.stack([W for _, _, W in draws], axis=1)
+        neighbors = stacked_neighbor_matrix([N_j for _, N_j, _ in draws])
+        alive = np.ones(len(draws), dtype=bool)
+        with np.errstate(over="ignore", invalid="ignore"):
+            for t in range(lines_to_initialize - 1, Y.shape[0] - 1):
+                Y[t + 1] = model_instance.step(Y, t, neighbors, W)
+                if early_exit:
+                    alive &= np.all(np.abs(Y[t + 1]) < 1e6, axis=-1)
+                    if not alive.any():
+                        break
+        return np.moveaxis(Y, 1, 0)
+
+    def _kernel(self, model_instance):
+        """
+        Returns the compiled recurrence of the model if `compiled` is set and one is registered, None otherwise.
+        """
+        if not self.compiled:
+            return None
+        # importing the module registers the kernels, if numba is available
+        import d2c.data_generation.kernels  # pylint: disable=import-outside-toplevel,unused-import
+
+        return model_registry.get_kernel(model_instance.model_id)
+
+    @staticmethod
+    def _valid_mask(series, threshold=1e-6, bound=1e6):
+        """
+        Flags the valid series of a stack of shape (..., time, variables).
+        A series is valid if it is finite, bounded by `bound` in absolute value and has no value smaller than `threshold` in absolute value.
+
+        Returns:
+            np.ndarray: A boolean array with the leading dimensions of `series`.
+        """
+        with np.errstate(invalid="ignore"):
+            # NaN fails every comparison, so it is flagged as well
+            valid = (np.abs(series) >= threshold) & (series > -bound) & (series < bound)
+        return valid.all(axis=(-2, -1))
 
     def get_generated_observations(self):
         """
@@ -250,3 +725,38 @@ class TSBuilder:
                 ),
                 f,
             )
+
+    @classmethod
+    def from_store(cls, path):
+        """
+        Loads the content of an on-disk store written by `build` with `output_dir`, rebuilding the DAGs from the neighbors.
+
+        Args:
+            path (str): Directory of the store.
+
+        Returns:
+            TSBuilder: A builder holding the stored time series, as if it had built them in memory.
+        """
+        with open(
+            os.path.join(path, ShardWriter.INDEX_FILE), "r", encoding="utf-8"
+        ) as f:
+            metadata = json.load(f)["metadata"]
+        builder = cls(**metadata, verbose=False)
+        model_instances = {
+            process_id: model_registry.get_model(process_id)()
+            for process_id in builder.processes_to_use
+        }
+        units = {}
+        for process_id, ts_index, observations, N_j in read_shards(path):
+            units[(process_id, ts_index)] = (observations, N_j)
+        for (process_id, ts_index), (observations, N_j) in sorted(units.items()):
+            builder.generated_observations.setdefault(process_id, {})[
+                ts_index
+            ] = observations
+            builder.generated_dags.setdefault(process_id, {})[ts_index] = (
+                model_instances[process_id].build_dag(
+                    T=builder.maxlags, N_j=N_j, N=builder.n_variables
+                )
+            )
+            builder.neighbors.setdefault(process_id, {})[ts_index] = N_j
+        return builder
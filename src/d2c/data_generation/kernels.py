@@ -0,0 +1,272 @@
+"""
+Compiled recurrences of the generative models in d2c.data_generation.models.
+
+Each model's update rule is written once on scalars and compiled with numba into a loop
+over the whole time horizon, registered in the model registry with `register_kernel`.
+A kernel is called as kernel(Y, indices, sizes, W, start, early_exit), where indices and sizes come from
+neighbor_matrix(N_j), and fills Y in place from row start + 1 onwards.
+With early_exit, it stops after the first row holding a non-finite value or a value beyond +-1e6.
+
+numba is optional: without it no kernel is registered and TSBuilder uses the models' step functions.
+The kernels agree with the update functions up to floating-point rounding (numba evaluates
+integer powers by repeated multiplication), they are not bit-identical.
+"""
+
+import math
+
+from d2c.data_generation.models import model_registry
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _recurrence(update):
+    """
+    Builds the compiled loop over time and variables around a compiled scalar update.
+    """
+
+    @njit
+    def kernel(Y, indices, sizes, W, start, early_exit):
+        n_variables = Y.shape[1]
+        for t in range(start, Y.shape[0] - 1):
+            for j in range(n_variables):
+                Y[t + 1, j] = update(Y, t, indices[j], sizes[j], W[t, j])
+            if early_exit:
+                for j in range(n_variables):
+                    if not abs(Y[t + 1, j]) < 1e6:
+                        return Y
+        return Y
+
+    return kernel
+
+
+def compiled(model_id):
+    """
+    Compiles a scalar update rule and registers its recurrence for the given model, if numba is available.
+    """
+
+    def inner_wrapper(update):
+        if njit is not None:
+            model_registry.register_kernel(model_id)(_recurrence(njit(update)))
+        return update
+
+    return inner_wrapper
+
+
+def mean_over_neighbors(Y_t, neighbors, size):
+    """
+    Mean over the first `size` entries of a row of the neighbor matrix, summed left to right like mean_over_indices.
+    """
+    total = 0.0
+    for k in range(size):
+        total += Y_t[neighbors[k]]
+    return total / size
+
+
+if njit is not None:
+    mean_over_neighbors = njit(mean_over_neighbors)
+
+
+@compiled(model_id=1)
+def model1(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+
+    term1 = -0.4 * (3 - Y_bar_t**2) / (1 + Y_bar_t**2)
+    term2 = (
+        0.6 * (3 - (Y_bar_t_minus_1 - 0.5) ** 3) / (1 + (Y_bar_t_minus_1 - 0.5) ** 4)
+    )
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=2)
+def model2(Y, t, neighbors, size, W):
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+    Y_bar_t_minus_2 = mean_over_neighbors(Y[t - 2], neighbors, size)
+
+    term1 = (0.4 - 2 * math.exp(-50 * Y_bar_t_minus_1**2)) * Y_bar_t_minus_1
+    term2 = (0.5 - 0.5 * math.exp(-50 * Y_bar_t_minus_2**2)) * Y_bar_t_minus_2
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=3)
+def model3(Y, t, neighbors, size, W):
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+    Y_bar_t_minus_2 = mean_over_neighbors(Y[t - 2], neighbors, size)
+
+    term1 = 1.5 * math.sin(math.pi / 2 * Y_bar_t_minus_1)
+    term2 = -math.sin(math.pi / 2 * Y_bar_t_minus_2)
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=4)
+def model4(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+
+    term1 = 2 * math.exp(-0.1 * Y_bar_t**2) * Y_bar_t
+    term2 = -math.exp(-0.1 * Y_bar_t_minus_1**2) * Y_bar_t_minus_1
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=5)
+def model5(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    indicator = 1.0 if Y_bar_t < 0 else 0.0
+
+    term1 = -2 * Y_bar_t * indicator
+    term2 = 0.4 * Y_bar_t * indicator
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=6)
+def model6(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    Y_bar_t_minus_2 = mean_over_neighbors(Y[t - 2], neighbors, size)
+
+    term1 = 0.8 * math.log(1 + 3 * Y_bar_t**2)
+    term2 = -0.6 * math.log(1 + 3 * Y_bar_t_minus_2**2)
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=7)
+def model7(Y, t, neighbors, size, W):
+    Y_bar_t_minus_2 = mean_over_neighbors(Y[t - 2], neighbors, size)
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+
+    term1_part1 = 0.4 - 2 * math.cos(40 * Y_bar_t_minus_2) * math.exp(
+        -30 * Y_bar_t_minus_2**2
+    )
+    term1 = term1_part1 * Y_bar_t_minus_2
+    term2 = (0.5 - 0.5 * math.exp(-50 * Y_bar_t_minus_1**2)) * Y_bar_t_minus_1
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=8)
+def model8(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    Y_bar_t_minus_2 = mean_over_neighbors(Y[t - 2], neighbors, size)
+
+    term1 = (0.5 - 1.1 * math.exp(-50 * Y_bar_t**2)) * Y_bar_t
+    term2 = (0.3 - 0.5 * math.exp(-50 * Y_bar_t_minus_2**2)) * Y_bar_t_minus_2
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=9)
+@compiled(model_id=12)
+def model9(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+
+    term1 = 0.3 * Y_bar_t
+    term2 = 0.6 * Y_bar_t_minus_1
+    term3_numerator = 0.1 - 0.9 * Y_bar_t + 0.8 * Y_bar_t_minus_1
+    term3_denominator = 1 + math.exp(-10 * Y_bar_t)
+    term3 = term3_numerator / term3_denominator
+
+    return term1 + term2 + term3 + W
+
+
+@compiled(model_id=10)
+def model10(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    sign = -1.0 if Y_bar_t < 0 else (1.0 if Y_bar_t > 0 else 0.0)
+    return sign + W
+
+
+@compiled(model_id=11)
+def model11(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    term1 = 0.8 * Y_bar_t
+    term2_denominator = 1 + math.exp(-10 * Y_bar_t)
+    term2 = -0.8 * Y_bar_t / term2_denominator
+
+    return term1 + term2 + W
+
+
+@compiled(model_id=13)
+def model13(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+
+    term1 = 0.38 * Y_bar_t * (1 - Y_bar_t_minus_1)
+
+    return term1 + W
+
+
+@compiled(model_id=14)
+def model14(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+
+    if Y_bar_t < 1:
+        return -0.5 * Y_bar_t + W
+    else:
+        return 0.4 * Y_bar_t + W
+
+
+@compiled(model_id=15)
+def model15(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+
+    if abs(Y_bar_t) < 1:
+        return 0.9 * Y_bar_t + W
+    else:
+        return -0.3 * Y_bar_t + W
+
+
+@compiled(model_id=16)
+def model16(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+
+    if t % 2 == 0:
+        return -0.5 * Y_bar_t + W
+    else:
+        return 0.4 * Y_bar_t + W
+
+
+@compiled(model_id=17)
+def model17(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+    Y_bar_t_minus_2 = mean_over_neighbors(Y[t - 2], neighbors, size)
+    Y_bar_t_minus_3 = mean_over_neighbors(Y[t - 3], neighbors, size)
+
+    squared_sum = (
+        Y_bar_t**2
+        + 0.3 * Y_bar_t_minus_1**2
+        + 0.2 * Y_bar_t_minus_2**2
+        + 0.1 * Y_bar_t_minus_3**2
+    )
+
+    coefficient = math.sqrt(0.000019 + 0.846 * squared_sum)
+
+    return coefficient * W
+
+
+@compiled(model_id=18)
+def model18(Y, t, neighbors, size, W):
+    Y_bar_t = mean_over_neighbors(Y[t], neighbors, size)
+    return 0.9 * Y_bar_t + W
+
+
+@compiled(model_id=19)
+def model19(Y, t, neighbors, size, W):
+    Y_bar_t_minus_1 = mean_over_neighbors(Y[t - 1], neighbors, size)
+    Y_bar_t_minus_2 = mean_over_neighbors(Y[t - 2], neighbors, size)
+    return 0.4 * Y_bar_t_minus_1 + 0.6 * Y_bar_t_minus_2 + W
+
+
+@compiled(model_id=20)
+def model20(Y, t, neighbors, size, W):
+    Y_bar_t_minus_3 = mean_over_neighbors(Y[t - 3], neighbors, size)
+    return 0.5 * Y_bar_t_minus_3 + W
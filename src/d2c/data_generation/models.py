@@ -1,4 +1,5 @@
 import math
+import numpy as np
 import networkx as nx
 
 def mean_over_indices(Y_t, indices):
@@ -7,6 +8,70 @@ def mean_over_indices(Y_t, indices):
     """
     return sum(Y_t[i] for i in indices) / len(indices)
 
+def neighbor_matrix(N_j):
+    """
+    Pack the neighborhoods N_j into a padded index matrix of shape (n_variables, max |N_j|).
+    Returns the index matrix, the flat position of the last neighbor of each row and the size of each neighborhood.
+    """
+    indices, last, sizes = stacked_neighbor_matrix([N_j])
+    return indices[0], last[0], sizes[0]
+
+def stacked_neighbor_matrix(N_js):
+    """
+    Neighbor matrix of several series simulated side by side, with Y[t] of shape (n_series, n_variables).
+    The indices address the flattened Y[t], so that series s only averages over its own row.
+    """
+    n_series, n_variables = len(N_js), len(N_js[0])
+    sizes = np.array([[len(neighborhood) for neighborhood in N_j] for N_j in N_js])
+    width = sizes.max()
+    indices = np.zeros((n_series, n_variables, width), dtype=int)
+    for s, N_j in enumerate(N_js):
+        for j, neighborhood in enumerate(N_j):
+            indices[s, j, : sizes[s, j]] = np.asarray(neighborhood) + s * n_variables
+    last = np.arange(n_series * n_variables).reshape(n_series, n_variables) * width + sizes - 1
+    return indices, last, sizes
+
+def mean_over_neighbors(Y_t, neighbors):
+    """
+    Array version of mean_over_indices: the mean over the neighborhood of every variable at once.
+    The terms are accumulated left to right (cumsum), as in the scalar sum, so the result is bit-identical.
+    """
+    indices, last, sizes = neighbors
+    return Y_t.ravel()[indices].cumsum(axis=-1).take(last) / sizes
+
+def _elementwise(func, nin=1):
+    """
+    Lift a scalar math function to float arrays.
+    NumPy's SIMD exp/log/power kernels may differ from the C math library in the last ulp,
+    so the step functions use the same scalar routines as the update functions.
+    """
+    ufunc = np.frompyfunc(func, nin, 1)
+    return lambda *args: ufunc(*args).astype(float)
+
+def _exp(x):
+    try:
+        return math.exp(x)
+    except OverflowError:
+        return math.inf
+
+def _pow(x, p):
+    try:
+        return x ** p
+    except OverflowError:
+        return math.copysign(math.inf, x) if p % 2 else math.inf
+
+def _sin(x):
+    return math.sin(x) if math.isfinite(x) else math.nan
+
+def _cos(x):
+    return math.cos(x) if math.isfinite(x) else math.nan
+
+exp = _elementwise(_exp)
+log = _elementwise(math.log)
+sin = _elementwise(_sin)
+cos = _elementwise(_cos)
+power = _elementwise(_pow, nin=2)
+
 def I(condition):
     """
     Indicator function.
@@ -42,11 +107,13 @@ def add_edges(G, T, N, N_j, time_from):
 class ModelRegistry:
     def __init__(self):
         self.registry = {}
+        self.kernels = {}
 
     def register(self, model_id):
         def inner_wrapper(wrapped_class):
             if model_id in self.registry:
                 print(f"Model ID {model_id} already exists. Overwriting.")
+            wrapped_class.model_id = model_id
             self.registry[model_id] = wrapped_class
             return wrapped_class
         return inner_wrapper
@@ -57,6 +124,22 @@ class ModelRegistry:
             raise ValueError(f"Model ID {model_id} does not exist.")
         return model
 
+    def register_kernel(self, model_id):
+        """
+        Registers a compiled recurrence for a model, running the whole time horizon in one call.
+        See d2c.data_generation.kernels for the expected signature.
+        """
+        def inner_wrapper(kernel):
+            self.kernels[model_id] = kernel
+            return kernel
+        return inner_wrapper
+
+    def get_kernel(self, model_id):
+        """
+        Returns the compiled recurrence of a model, or None if there is none (e.g. numba is not installed).
+        """
+        return self.kernels.get(model_id)
+
 # Instantiate the registry
 model_registry = ModelRegistry()
 
@@ -68,6 +151,15 @@ class BaseModel:
     def update(Y, t, j, N_j, W):
         pass
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        """
+        Array-level update: computes Y[t+1] for all the variables at once.
+        neighbors is the output of neighbor_matrix(N_j). Y and W can also be time-major stacks
+        of shape (time, n_series, n_variables), with neighbors from stacked_neighbor_matrix.
+        """
+        pass
+
     def build_dag(self,T, N_j, N):
         return add_edges(nx.DiGraph(),T,N,N_j,self.time_from) 
     
@@ -94,6 +186,16 @@ class Model1(BaseModel):
 
         return term1 + term2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+
+        term1 = -0.4 * (3 - power(Y_bar_t, 2)) / (1 + power(Y_bar_t, 2))
+        term2 = 0.6 * (3 - power(Y_bar_t_minus_1 - 0.5, 3)) / (1 + power(Y_bar_t_minus_1 - 0.5, 4))
+
+        return term1 + term2 + W[t]
+
 @model_registry.register(model_id=2)
 class Model2(BaseModel):
     """
@@ -114,6 +216,16 @@ class Model2(BaseModel):
         term2 = (0.5 - 0.5 * math.exp(-50 * Y_bar_t_minus_2**2)) * Y_bar_t_minus_2
 
         return term1 + term2 + W[t][j]
+
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+        Y_bar_t_minus_2 = mean_over_neighbors(Y[t-2], neighbors)
+
+        term1 = (0.4 - 2 * exp(-50 * power(Y_bar_t_minus_1, 2))) * Y_bar_t_minus_1
+        term2 = (0.5 - 0.5 * exp(-50 * power(Y_bar_t_minus_2, 2))) * Y_bar_t_minus_2
+
+        return term1 + term2 + W[t]
     
 @model_registry.register(model_id=3)
 class Model3(BaseModel):
@@ -135,6 +247,16 @@ class Model3(BaseModel):
 
         return term1 + term2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+        Y_bar_t_minus_2 = mean_over_neighbors(Y[t-2], neighbors)
+
+        term1 = 1.5 * sin(math.pi / 2 * Y_bar_t_minus_1)
+        term2 = -sin(math.pi / 2 * Y_bar_t_minus_2)
+
+        return term1 + term2 + W[t]
+
 @model_registry.register(model_id=4)
 class Model4(BaseModel):
     """
@@ -156,6 +278,16 @@ class Model4(BaseModel):
 
         return term1 + term2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+
+        term1 = 2 * exp(-0.1 * power(Y_bar_t, 2)) * Y_bar_t
+        term2 = -exp(-0.1 * power(Y_bar_t_minus_1, 2)) * Y_bar_t_minus_1
+
+        return term1 + term2 + W[t]
+
 @model_registry.register(model_id=5)
 class Model5(BaseModel):
     """
@@ -175,6 +307,15 @@ class Model5(BaseModel):
 
         return term1 + term2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+
+        term1 = -2 * Y_bar_t * (Y_bar_t < 0)
+        term2 = 0.4 * Y_bar_t * (Y_bar_t < 0)
+
+        return term1 + term2 + W[t]
+
 @model_registry.register(model_id=6)
 class Model6(BaseModel):
     """
@@ -195,6 +336,16 @@ class Model6(BaseModel):
 
         return term1 + term2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        Y_bar_t_minus_2 = mean_over_neighbors(Y[t-2], neighbors)
+
+        term1 = 0.8 * log(1 + 3 * power(Y_bar_t, 2))
+        term2 = -0.6 * log(1 + 3 * power(Y_bar_t_minus_2, 2))
+
+        return term1 + term2 + W[t]
+
 @model_registry.register(model_id=7)
 class Model7(BaseModel):
     """
@@ -217,6 +368,17 @@ class Model7(BaseModel):
 
         return term1 + term2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t_minus_2 = mean_over_neighbors(Y[t-2], neighbors)
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+
+        term1_part1 = 0.4 - 2 * cos(40 * Y_bar_t_minus_2) * exp(-30 * power(Y_bar_t_minus_2, 2))
+        term1 = term1_part1 * Y_bar_t_minus_2
+        term2 = (0.5 - 0.5 * exp(-50 * power(Y_bar_t_minus_1, 2))) * Y_bar_t_minus_1
+
+        return term1 + term2 + W[t]
+
 @model_registry.register(model_id=8)
 class Model8(BaseModel):
     """
@@ -238,6 +400,16 @@ class Model8(BaseModel):
 
         return term1 + term2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        Y_bar_t_minus_2 = mean_over_neighbors(Y[t-2], neighbors)
+
+        term1 = (0.5 - 1.1 * exp(-50 * power(Y_bar_t, 2))) * Y_bar_t
+        term2 = (0.3 - 0.5 * exp(-50 * power(Y_bar_t_minus_2, 2))) * Y_bar_t_minus_2
+
+        return term1 + term2 + W[t]
+
 @model_registry.register(model_id=9)
 class Model9(BaseModel):
     """
@@ -261,6 +433,19 @@ class Model9(BaseModel):
 
         return term1 + term2 + term3 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+
+        term1 = 0.3 * Y_bar_t
+        term2 = 0.6 * Y_bar_t_minus_1
+        term3_numerator = 0.1 - 0.9 * Y_bar_t + 0.8 * Y_bar_t_minus_1
+        term3_denominator = 1 + exp(-10 * Y_bar_t)
+        term3 = term3_numerator / term3_denominator
+
+        return term1 + term2 + term3 + W[t]
+
 @model_registry.register(model_id=10)
 class Model10(BaseModel):
     """
@@ -276,6 +461,11 @@ class Model10(BaseModel):
         Y_bar_t = mean_over_indices(Y[t], N_j)
         return sign(Y_bar_t) + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        return np.where(Y_bar_t < 0, -1, np.where(Y_bar_t > 0, 1, 0)) + W[t]
+
 @model_registry.register(model_id=11)    
 class Model11(BaseModel):
     """
@@ -296,6 +486,15 @@ class Model11(BaseModel):
 
         return term1 + term2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        term1 = 0.8 * Y_bar_t
+        term2_denominator = 1 + exp(-10 * Y_bar_t)
+        term2 = -0.8 * Y_bar_t / term2_denominator
+
+        return term1 + term2 + W[t]
+
 @model_registry.register(model_id=12)
 class Model12(BaseModel):
     """
@@ -319,6 +518,19 @@ class Model12(BaseModel):
         term3 = term3_numerator / term3_denominator
 
         return term1 + term2 + term3 + W[t][j]
+
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+
+        term1 = 0.3 * Y_bar_t
+        term2 = 0.6 * Y_bar_t_minus_1
+        term3_numerator = 0.1 - 0.9 * Y_bar_t + 0.8 * Y_bar_t_minus_1
+        term3_denominator = 1 + exp(-10 * Y_bar_t)
+        term3 = term3_numerator / term3_denominator
+
+        return term1 + term2 + term3 + W[t]
     
 @model_registry.register(model_id=13)
 class Model13(BaseModel):
@@ -338,6 +550,15 @@ class Model13(BaseModel):
         term1 = 0.38 * Y_bar_t * (1 - Y_bar_t_minus_1)
 
         return term1 + W[t][j]
+
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+
+        term1 = 0.38 * Y_bar_t * (1 - Y_bar_t_minus_1)
+
+        return term1 + W[t]
     
 @model_registry.register(model_id=14)
 class Model14(BaseModel):
@@ -358,6 +579,12 @@ class Model14(BaseModel):
         else:
             return 0.4 * Y_bar_t + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+
+        return np.where(Y_bar_t < 1, -0.5 * Y_bar_t, 0.4 * Y_bar_t) + W[t]
+
 @model_registry.register(model_id=15)    
 class Model15(BaseModel):
     """
@@ -377,6 +604,12 @@ class Model15(BaseModel):
         else:
             return -0.3 * Y_bar_t + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+
+        return np.where(np.abs(Y_bar_t) < 1, 0.9 * Y_bar_t, -0.3 * Y_bar_t) + W[t]
+
 @model_registry.register(model_id=16)    
 class Model16(BaseModel):
     """
@@ -399,6 +632,15 @@ class Model16(BaseModel):
         else:
             return 0.4 * Y_bar_t + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+
+        if t % 2 == 0:
+            return -0.5 * Y_bar_t + W[t]
+        else:
+            return 0.4 * Y_bar_t + W[t]
+
 @model_registry.register(model_id=17)    
 class Model17(BaseModel):
     """
@@ -427,6 +669,24 @@ class Model17(BaseModel):
 
         return coefficient * W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+        Y_bar_t_minus_2 = mean_over_neighbors(Y[t-2], neighbors)
+        Y_bar_t_minus_3 = mean_over_neighbors(Y[t-3], neighbors)
+
+        squared_sum = (
+            power(Y_bar_t, 2) + 
+            0.3 * power(Y_bar_t_minus_1, 2) + 
+            0.2 * power(Y_bar_t_minus_2, 2) + 
+            0.1 * power(Y_bar_t_minus_3, 2)
+        )
+
+        coefficient = np.sqrt(0.000019 + 0.846 * squared_sum)
+
+        return coefficient * W[t]
+
 @model_registry.register(model_id=18)    
 class Model18(BaseModel):
     """
@@ -443,6 +703,11 @@ class Model18(BaseModel):
         Y_bar_t = mean_over_indices(Y[t], N_j)
         return 0.9 * Y_bar_t + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t = mean_over_neighbors(Y[t], neighbors)
+        return 0.9 * Y_bar_t + W[t]
+
 @model_registry.register(model_id=19)    
 class Model19(BaseModel):
     """
@@ -460,6 +725,12 @@ class Model19(BaseModel):
         Y_bar_t_minus_2 = mean_over_indices(Y[t-2], N_j)
         return 0.4 * Y_bar_t_minus_1 + 0.6 * Y_bar_t_minus_2 + W[t][j]
 
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t_minus_1 = mean_over_neighbors(Y[t-1], neighbors)
+        Y_bar_t_minus_2 = mean_over_neighbors(Y[t-2], neighbors)
+        return 0.4 * Y_bar_t_minus_1 + 0.6 * Y_bar_t_minus_2 + W[t]
+
 @model_registry.register(model_id=20)
 class Model20(BaseModel):
     """
@@ -474,4 +745,9 @@ class Model20(BaseModel):
     @staticmethod
     def update( Y, t, j, N_j, W):
         Y_bar_t_minus_3 = mean_over_indices(Y[t-3], N_j)
-        return 0.5 * Y_bar_t_minus_3 + W[t][j]
\ No newline at end of file
+        return 0.5 * Y_bar_t_minus_3 + W[t][j]
+
+    @staticmethod
+    def step(Y, t, neighbors, W):
+        Y_bar_t_minus_3 = mean_over_neighbors(Y[t-3], neighbors)
+        return 0.5 * Y_bar_t_minus_3 + W[t]
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""
+This module is responsible for streaming generated time series to disk.
+
+A store is a directory holding numbered `.npz` shards and a small `index.json`.
+Each shard contains a batch of finished time series, stacked in one array, with their process ids, time series indices and neighborhoods.
+The index records the generation parameters and, for each shard, the (process, time series) couples it contains,
+so that an interrupted build can resume after the last finished shard.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+class ShardWriter:
+    """
+    ShardWriter appends finished time series to an on-disk store, a shard at a time.
+
+    Attributes:
+        path (str): Directory of the store.
+        shard_size (int): Number of time series buffered before a shard is written.
+        index (dict): Content of the index file.
+
+    Methods:
+        __init__(self, path, metadata, shard_size=1000):
+
+        append(self, process_id, ts_index, observations, neighbors):
+
+        checkpoint(self, rng_state=None):
+
+        close(self):
+
+        get_done(self):
+
+        get_rng_state(self):
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, path, metadata, shard_size=1000):
+        """
+        Opens a store, creating it if needed.
+
+        Args:
+            path (str): Directory of the store.
+            metadata (dict): Generation parameters. They must match the ones of an existing store.
+            shard_size (int): Number of time series per shard.
+
+        Raises:
+            ValueError: If the store exists and was created with different parameters.
+        """
+        self.path = path
+        self.shard_size = shard_size
+        self.buffer = []
+
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, self.INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+            if self.index["metadata"] != metadata:
+                raise ValueError(
+                    f"The store in {path} was generated with different parameters: {self.index['metadata']}"
+                )
+        else:
+            self.index = {"metadata": metadata, "shards": []}
+
+    def append(self, process_id, ts_index, observations, neighbors):
+        """
+        Buffers a finished time series. It is written at the next checkpoint after the buffer is full.
+        """
+        self.buffer.append((process_id, ts_index, observations, neighbors))
+
+    def checkpoint(self, rng_state=None):
+        """
+        Writes the buffered time series if there are at least `shard_size` of them.
+        The caller must only checkpoint when the buffered time series are exactly the ones generated so far,
+        so that `rng_state`, the global random state at this point, is the one to resume from.
+        """
+        if len(self.buffer) >= self.shard_size:
+            self._write_shard(rng_state)
+
+    def close(self):
+        """
+        Writes the remaining buffered time series.
+        """
+        if self.buffer:
+            self._write_shard()
+
+    def get_done(self):
+        """
+        Returns the set of (process_id, ts_index) couples already written.
+        """
+        return {
+            tuple(unit) for shard in self.index["shards"] for unit in shard["units"]
+        }
+
+    def get_rng_state(self):
+        """
+        Returns the global random state recorded with the last shard, or None.
+        """
+        if not self.index["shards"]:
+            return None
+        with np.load(
+            os.path.join(self.path, self.index["shards"][-1]["file"])
+        ) as shard:
+            if "rng_keys" not in shard:
+                return None
+            return (
+                "MT19937",
+                shard["rng_keys"],
+                int(shard["rng_pos"]),
+                int(shard["rng_has_gauss"]),
+                float(shard["rng_cached_gaussian"]),
+            )
+
+    def _write_shard(self, rng_state=None):
+        """
+        Writes the buffer to a new shard, then records it in the index.
+        The index is replaced atomically, so a crash never leaves a shard half-registered.
+        """
+        n_variables = len(self.buffer[0][3])
+        width = max(
+            len(neighborhood) for *_, N_j in self.buffer for neighborhood in N_j
+        )
+        neighbors = np.full((len(self.buffer), n_variables, width), -1)
+        for s, (*_, N_j) in enumerate(self.buffer):
+            for j, neighborhood in enumerate(N_j):
+                neighbors[s, j, : len(neighborhood)] = neighborhood
+
+        arrays = {
+            "observations": np.stack([obs for _, _, obs, _ in self.buffer]),
+            "process_ids": np.array([p for p, _, _, _ in self.buffer]),
+            "ts_indices": np.array([ts for _, ts, _, _ in self.buffer]),
+            "neighbors": neighbors,
+        }
+        if rng_state is not None:
+            _, keys, pos, has_gauss, cached_gaussian = rng_state
+            arrays.update(
+                rng_keys=keys,
+                rng_pos=pos,
+                rng_has_gauss=has_gauss,
+                rng_cached_gaussian=cached_gaussian,
+            )
+
+        file_name = f"shard_{len(self.index['shards']):05d}.npz"
+        np.savez(os.path.join(self.path, file_name), **arrays)
+
+        self.index["shards"].append(
+            {
+                "file": file_name,
+                "units": [[int(p), int(ts)] for p, ts, _, _ in self.buffer],
+            }
+        )
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(index_path + ".tmp", index_path)
+
+        self.buffer = []
+
+
+def read_shards(path):
+    """
+    Reads a store back, one shard at a time.
+
+    Args:
+        path (str): Directory of the store.
+
+    Yields:
+        tuple: (process_id, ts_index, observations, neighbors) for every time series, in the order they were written.
+    """
+    with open(os.path.join(path, ShardWriter.INDEX_FILE), "r", encoding="utf-8") as f:
+        index = json.load(f)
+    for shard_info in index["shards"]:
+        with np.load(os.path.join(path, shard_info["file"])) as shard:
+            observations = shard["observations"]
+            neighbors = shard["neighbors"]
+            for s, (process_id, ts_index) in enumerate(
+                zip(shard["process_ids"], shard["ts_indices"])
+            ):
+                N_j = [row[row >= 0] for row in neighbors[s]]
+                yield int(process_id), int(ts_index), observations[s], N_j
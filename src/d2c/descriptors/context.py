@@ -0,0 +1,66 @@
+"""
+This module contains the SeriesContext, holding what the descriptors of all the couples of a series have in common.
+"""
+
+import numpy as np
+from scipy.stats import kurtosis, skew
+
+
+class SeriesContext:
+    """
+    Quantities of one series that do not depend on the couple of nodes considered,
+    computed once and shared by all the couples of the series.
+
+    The per-column moments are computed column by column, with the same calls as the per-couple code,
+    so that the descriptors are unchanged.
+
+    Attributes:
+        observations (numpy.ndarray): The (possibly standardized) observations of the series.
+        mean (numpy.ndarray): The mean of each column.
+        std (numpy.ndarray): The standard deviation of each column.
+        kurtosis (numpy.ndarray): The kurtosis of each column.
+        skewness (numpy.ndarray): The skewness of each column.
+        centered (numpy.ndarray): The observations minus the mean of their column.
+
+    Methods:
+        __init__(self, observations, markov_blanket_function):
+
+        markov_blanket(self, node):
+
+        hoc(self, x, y, i, j):
+    """
+
+    def __init__(self, observations, markov_blanket_function):
+        """
+        Parameters:
+        - observations (numpy.ndarray): The observations of the series, already standardized if needed.
+        - markov_blanket_function (callable): Estimates the Markov blanket of a node, as f(observations, node).
+        """
+        self.observations = observations
+        self._markov_blanket_function = markov_blanket_function
+        self._markov_blankets = {}
+
+        columns = [observations[:, j] for j in range(observations.shape[1])]
+        self.mean = np.array([np.mean(column) for column in columns])
+        self.std = np.array([np.std(column) for column in columns])
+        self.kurtosis = np.array([kurtosis(column) for column in columns])
+        self.skewness = np.array([skew(column) for column in columns])
+        self.centered = observations - self.mean
+
+    def markov_blanket(self, node):
+        """
+        Returns the estimated Markov blanket of a node, estimated on first request only.
+        """
+        if node not in self._markov_blankets:
+            self._markov_blankets[node] = self._markov_blanket_function(
+                self.observations, node
+            )
+        return self._markov_blankets[node]
+
+    def hoc(self, x, y, i, j):
+        """
+        High Order Correlation between columns x and y, as d2c.descriptors.utils.HOC.
+        """
+        return np.mean(self.centered[:, x] ** i * self.centered[:, y] ** j) / (
+            self.std[x] ** i * self.std[y] ** j
+        )
@@ -1,14 +1,68 @@
-from multiprocessing import Pool
+import copy
+from multiprocessing import Manager, Pool, shared_memory
 import pandas as pd
 import numpy as np
-from scipy.stats import kurtosis, skew
 
-from d2c.descriptors.utils import coeff, HOC
+from d2c.descriptors.context import SeriesContext
+from d2c.descriptors.schema import DescriptorSchema
+from d2c.descriptors.store import DescriptorWriter, read_descriptor_shards
+from d2c.descriptors.utils import coeff
 from d2c.descriptors.estimators import (
     MarkovBlanketEstimator,
+    MSECache,
     MutualInformationEstimator,
 )
 
+# state of a worker process of the parallel computations, set by _init_worker
+_worker_d2c = None
+_worker_memory = None
+_worker_output = None
+
+
+def _share_observations(observations, indices):
+    """
+    Copies the observations of the given series into a single block of shared memory.
+
+    Returns:
+        tuple: The shared memory block and the layout of the observations in it, as (index, offset, shape, dtype).
+    """
+    arrays = [np.asarray(observations[index]) for index in indices]
+    layout = []
+    size = 0
+    for index, array in zip(indices, arrays):
+        layout.append((index, size, array.shape, array.dtype.str))
+        size += -(-array.nbytes // 64) * 64  # keep every array aligned
+    memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for array, (_, offset, shape, dtype) in zip(arrays, layout):
+        np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)[...] = array
+    return memory, layout
+
+
+def _init_worker(d2c, memory_name, layout, output_name, output_layout):
+    """
+    Initializes a worker process: the observations are read-only views on the shared memory, not copies,
+    and the descriptors are written in the rows of a shared output matrix.
+    """
+    global _worker_d2c, _worker_memory, _worker_output  # pylint: disable=global-statement
+    _worker_memory = shared_memory.SharedMemory(name=memory_name)
+    output_memory = shared_memory.SharedMemory(name=output_name)
+    shape, dtype = output_layout
+    _worker_output = (
+        output_memory,
+        np.ndarray(shape, dtype=dtype, buffer=output_memory.buf),
+    )
+    observations = {}
+    for index, offset, shape, dtype in layout:
+        obs = np.ndarray(shape, dtype=dtype, buffer=_worker_memory.buf, offset=offset)
+        obs.flags.writeable = False
+        observations[index] = obs
+    d2c.observations = observations
+    _worker_d2c = d2c
+
+
+def _fill_descriptors(row, dag_idx, ca, ef, label):
+    _worker_d2c.fill_descriptors(_worker_output[1][row], dag_idx, ca, ef, label)
+
 
 class D2C:
     """
@@ -24,11 +78,20 @@ class D2C:
         verbose (bool, optional): Whether to print verbose output. Defaults to False.
         seed (int, optional): Random seed for reproducibility. Defaults to 42.
         n_jobs (int, optional): Number of parallel jobs to run. Defaults to 1.
+        mb_estimator (str, optional): How the Markov blankets are estimated: "original" ranks the columns by correlation,
+            "ridge" by ridge regression coefficients, "ts" takes the neighboring lags of a node,
+            "mrmr" selects by Max-Relevance Min-Redundancy. Defaults to "original".
+        dtype (numpy.dtype, optional): Type of the matrix of descriptors, float64 or float32. Defaults to np.float64.
+            float32 only holds the ids of the DAGs and the nodes, and the sizes of the series, exactly up to 2**24.
+        output_dir (str, optional): Directory where initialize streams the descriptors, in shards. Defaults to None.
+        shard_size (int, optional): Number of couples after which a shard is written. Defaults to 10000.
+        share_mse_cache (bool, optional): Whether the parallel workers share the MSEs they compute. Defaults to False.
 
     Attributes:
         DAGs (list): List of DAGs representing causal relationships.
         dag_to_observation (dict): Mapping of DAG index to corresponding observation.
-        x_y (None): Placeholder for computed descriptors.
+        x_y (numpy.ndarray): Matrix of the computed descriptors, a row per couple, laid out by `schema`.
+        schema (DescriptorSchema): Columns of the descriptors.
         n_variables (int): Number of variables in the time series.
         maxlags (int): Maximum number of lags in the time series.
         test_couples (list): List of couples for which descriptors have been computed.
@@ -47,8 +110,12 @@ class D2C:
             Compute all descriptors when a DAG is not available.
         compute_descriptors_with_dag(self, dag_idx, dag, n_variables, maxlags, num_samples=20):
             Compute all descriptors associated to a DAG.
+        select_couples(self, dag, n_variables, maxlags, num_samples=20):
+            Select the couples of a DAG to compute the descriptors of, with their labels.
         get_markov_blanket(self, dag, node):
             Compute the REAL Markov Blanket of a node in a specific DAG.
+        get_context(self, dag_idx):
+            Get the quantities of a series shared by all its couples.
         standardize_data(self, observations):
             Standardize the observation DataFrame.
         check_data_validity(self, observations):
@@ -59,8 +126,12 @@ class D2C:
             Update the dictionary with distribution moments.
         update_dictionary_actual_values(self, dictionary, name, values):
             Update the dictionary with actual values.
+        estimate_cmi_batch(self, observations, triples):
+            Estimate many conditional mutual informations on the same observations at once.
         compute_descriptors_for_couple(self, dag_idx, ca, ef, label):
             Compute descriptors for a given couple of nodes in a DAG.
+        fill_descriptors(self, row, dag_idx, ca, ef, label):
+            Compute the descriptors of a couple into a row of the descriptor matrix.
         get_descriptors_df(self):
             Get the concatenated DataFrame of X and Y.
         get_test_couples(self):
@@ -85,6 +156,10 @@ class D2C:
         mb_estimator="original",
         seed=42,
         n_jobs=1,
+        dtype=np.float64,
+        output_dir=None,
+        shard_size=10000,
+        share_mse_cache=False,
     ) -> None:
 
         self.DAGs = dags
@@ -96,17 +171,24 @@ class D2C:
         self.proxy_params = proxy_params
         self.verbose = verbose
         self.n_jobs = n_jobs
+        self.dtype = dtype
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.share_mse_cache = share_mse_cache
         self.seed = seed
         self.cmi = cmi
         self.normalize = normalize
 
-        self.x_y = None  # Placeholder for computed descriptors, list of dictionaries
+        self.x_y = None  # Placeholder for computed descriptors, a matrix laid out by the schema
         self.test_couples = (
             []
         )  # List of couples for which descriptors have been computed
 
         self.markov_blanket_estimator = MarkovBlanketEstimator(
-            size=min(MB_size, n_variables - 2), n_variables=n_variables, maxlags=maxlags
+            size=min(MB_size, n_variables - 2),
+            n_variables=n_variables,
+            maxlags=maxlags,
+            engine="ridge" if mb_estimator == "ridge" else "matrix",
         )
 
         self.mb_estimator = mb_estimator
@@ -118,6 +200,16 @@ class D2C:
 
         self.quantiles = quantiles
         self.full = full
+        self.schema = DescriptorSchema(
+            full,
+            quantiles,
+            # the time series estimator only returns the previous and the next lag of a node
+            2 if mb_estimator == "ts" else self.markov_blanket_estimator.size,
+        )
+
+        # the context of the series being processed, shared by its couples
+        self._context = None
+        self._context_idx = None
 
         np.random.seed(seed)
 
@@ -125,6 +217,12 @@ class D2C:
         """
         Initialize the D2C object by computing descriptors in parallel for all observations.
 
+        The couples of each DAG are drawn from its own random stream (see get_dag_rng),
+        so they do not depend on n_jobs, on the order of the DAGs, nor on the DAGs already processed.
+
+        With an output_dir, the descriptors are not kept in memory but written to a store, DAG after DAG,
+        in shards of about shard_size couples, with the test couples of their DAGs.
+        The DAGs already in the store are skipped, so an interrupted run resumes where it stopped, with the same output.
         """
         if self.couples_to_consider_per_dag == -1:
             num_samples = -1
@@ -133,29 +231,189 @@ class D2C:
                 self.couples_to_consider_per_dag // 3
             )  # because 1/3 is causal A->B, 1/3 is B->A, 1/3 is other non-causal that respect time
 
-        if self.n_jobs == 1:
-            results = [
-                self.compute_descriptors_with_dag(
-                    dag_idx,
+        self._context_idx = None  # the observations may have changed since the last run
+
+        def select(dag_idx, dag):
+            return [
+                (dag_idx, ca, ef, label)
+                for ca, ef, label in self.select_couples(
                     dag,
                     self.n_variables,
                     self.maxlags,
                     num_samples=num_samples,
+                    rng=self.get_dag_rng(dag_idx),
                 )
-                for dag_idx, dag in enumerate(self.DAGs)
             ]
 
-        else:
-            args = [
-                (dag_idx, dag, self.n_variables, self.maxlags, num_samples)
-                for dag_idx, dag in enumerate(self.DAGs)
-            ]
-            with Pool(processes=self.n_jobs) as pool:
-                results = pool.starmap(self.compute_descriptors_with_dag, args)
+        if self.output_dir is None:
+            self.x_y = self._compute_descriptors_for_couples(
+                [
+                    couple
+                    for dag_idx, dag in enumerate(self.DAGs)
+                    for couple in select(dag_idx, dag)
+                ]
+            )
+            return
+
+        self.x_y = None
+        writer = DescriptorWriter(self.output_dir, self._store_metadata())
+        done = writer.get_done()
+        self.test_couples.extend(writer.get_test_couples())
+
+        dags, batch, first_couple = [], [], len(self.test_couples)
+        for dag_idx, dag in enumerate(self.DAGs):
+            if dag_idx in done:
+                continue
+            dags.append(dag_idx)
+            batch.extend(select(dag_idx, dag))
+            if len(batch) >= self.shard_size:
+                writer.write(
+                    dags,
+                    self._compute_descriptors_for_couples(batch),
+                    self.test_couples[first_couple:],
+                )
+                dags, batch, first_couple = [], [], len(self.test_couples)
+        if dags:
+            writer.write(
+                dags,
+                self._compute_descriptors_for_couples(batch),
+                self.test_couples[first_couple:],
+            )
+
+    def get_dag_rng(self, dag_idx):
+        """
+        Returns the random generator of the couple selection of a DAG, derived from the seed and the DAG index.
+        """
+        return np.random.default_rng(
+            np.random.SeedSequence(self.seed, spawn_key=(dag_idx,))
+        )
+
+    def _store_metadata(self):
+        """
+        The parameters that determine the descriptors, recorded in the store to check a resumed run against them.
+        """
+        return {
+            "n_dags": len(self.DAGs),
+            "couples_to_consider_per_dag": self.couples_to_consider_per_dag,
+            "MB_size": self.markov_blanket_estimator.size,
+            "n_variables": self.n_variables,
+            "maxlags": self.maxlags,
+            "mutual_information_proxy": self.mutual_information_proxy,
+            "proxy_params": self.proxy_params,
+            "full": self.full,
+            "quantiles": self.quantiles,
+            "normalize": self.normalize,
+            "cmi": self.cmi,
+            "mb_estimator": self.mb_estimator,
+            "seed": self.seed,
+            "dtype": np.dtype(self.dtype).str,
+            "columns": self.schema.columns,
+        }
+
+    def _worker_copy(self, shared_mses=None):
+        """
+        Returns the copy of D2C sent to the parallel workers: the configuration, without the data
+        nor the caches of the estimators, which only hold results on the series of the parent.
+
+        Args:
+            shared_mses (dict, optional): The dictionary through which the workers share their MSEs. Defaults to None.
+        """
+        worker_d2c = copy.copy(self)
+        worker_d2c.DAGs = None
+        worker_d2c.observations = None
+        worker_d2c.x_y = None
+        worker_d2c.test_couples = []
+        worker_d2c._context = None
+        worker_d2c._context_idx = None
+
+        markov_blanket_estimator = copy.copy(self.markov_blanket_estimator)
+        markov_blanket_estimator._ranked_dataset = None
+        markov_blanket_estimator._blankets = None
+        markov_blanket_estimator._mi_dataset = None
+        markov_blanket_estimator._mi_matrix = None
+        worker_d2c.markov_blanket_estimator = markov_blanket_estimator
+
+        mutual_information_estimator = copy.copy(self.mutual_information_estimator)
+        mutual_information_estimator.mse_cache = MSECache(
+            maxsize=self.mutual_information_estimator.mse_cache.maxsize,
+            shared=shared_mses,
+        )
+        mutual_information_estimator._ridge_mse = None
+        mutual_information_estimator._fingerprinted = None
+        mutual_information_estimator._fingerprint = None
+        mutual_information_estimator._cmi_memo = {}
+        mutual_information_estimator._cmi_memo_id = None
+        mutual_information_estimator._trees = {}
+        mutual_information_estimator._tree_dataset = None
+        worker_d2c.mutual_information_estimator = mutual_information_estimator
+        return worker_d2c
+
+    def _compute_descriptors_for_couples(self, couples):
+        """
+        Compute the descriptors of (dag_idx, ca, ef, label) couples into the rows of a matrix, in order.
+        With n_jobs > 1, the observations are placed once in shared memory, the workers only receive the couples
+        and write their rows directly in a shared matrix.
+        """
+        # the ids, and the sizes of the series, are written in the matrix as floats
+        largest = max((max(couple[:3]) for couple in couples), default=0)
+        if self.full:
+            largest = max(
+                [largest]
+                + [
+                    max(self.observations[dag_idx].shape)
+                    for dag_idx in {couple[0] for couple in couples}
+                ]
+            )
+        self.schema.check_exact(self.dtype, largest)
+
+        x_y = self.schema.allocate(len(couples), dtype=self.dtype)
+        if self.n_jobs == 1:
+            for row, (dag_idx, ca, ef, label) in zip(x_y, couples):
+                self.fill_descriptors(row, dag_idx, ca, ef, label)
+            return x_y
+
+        manager = None
+        if self.share_mse_cache:
+            # the workers consult each other's MSEs through a dictionary held by a manager process
+            manager = Manager()
+        worker_d2c = self._worker_copy(
+            shared_mses=manager.dict() if manager is not None else None
+        )
 
-        # merge lists into a single list
-        results = [item for sublist in results for item in sublist]
-        self.x_y = results
+        # only the series of the couples are shared
+        memory, layout = _share_observations(
+            self.observations, sorted({couple[0] for couple in couples})
+        )
+        output = shared_memory.SharedMemory(create=True, size=max(x_y.nbytes, 1))
+        try:
+            shared_x_y = np.ndarray(x_y.shape, dtype=x_y.dtype, buffer=output.buf)
+            shared_x_y[...] = x_y
+            with Pool(
+                processes=self.n_jobs,
+                initializer=_init_worker,
+                initargs=(
+                    worker_d2c,
+                    memory.name,
+                    layout,
+                    output.name,
+                    (x_y.shape, x_y.dtype.str),
+                ),
+            ) as pool:
+                pool.starmap(
+                    _fill_descriptors,
+                    [(row,) + tuple(couple) for row, couple in enumerate(couples)],
+                    chunksize=max(1, len(couples) // (4 * self.n_jobs)),
+                )
+            x_y[...] = shared_x_y
+            return x_y
+        finally:
+            shared_x_y = None  # the block cannot be closed while a view on it exists
+            memory.close()
+            memory.unlink()
+            output.close()
+            output.unlink()
+            if manager is not None:
+                manager.shutdown()
 
     def compute_descriptors_without_dag(self, n_variables, maxlags) -> list:
         """
@@ -174,18 +432,12 @@ class D2C:
             if i != j
         }
 
-        if self.n_jobs == 1:
-            results = [
-                self.compute_descriptors_for_couple(dag_idx=0, ca=a, ef=b, label=np.nan)
-                for a, b in all_possible_links
-            ]
-
-        else:
-            args = [(0, a, b, np.nan) for a, b in all_possible_links]
-            with Pool(processes=self.n_jobs) as pool:
-                results = pool.starmap(self.compute_descriptors_for_couple, args)
+        self._context_idx = None  # the observations may have changed since the last run
+        x_y = self._compute_descriptors_for_couples(
+            [(0, a, b, np.nan) for a, b in all_possible_links]
+        )
 
-        return pd.DataFrame(results)
+        return self.schema.to_frame(x_y)
 
     def compute_descriptors_with_dag(
         self, dag_idx, dag, n_variables, maxlags, num_samples=20
@@ -206,7 +458,38 @@ class D2C:
             List of couples contains the computed descriptors, and the labels (1 for causal links, 0 for non-causal links).
         """
 
-        x_y_couples = []
+        return [
+            self.compute_descriptors_for_couple(dag_idx, ca, ef, label=label)
+            for ca, ef, label in self.select_couples(
+                dag,
+                n_variables,
+                maxlags,
+                num_samples=num_samples,
+                rng=self.get_dag_rng(dag_idx),
+            )
+        ]
+
+    def select_couples(
+        self, dag, n_variables, maxlags, num_samples=20, rng=None
+    ) -> list:
+        """
+        Select the couples of a DAG to compute the descriptors of, and record them in test_couples.
+        With num_samples == -1, every time-ordered couple is selected.
+        Otherwise, up to num_samples causal links are drawn, each with its reversed (non-causal) couple,
+        and up to num_samples non-causal, time-ordered couples.
+
+        Args:
+            dag (networkx.DiGraph): The directed acyclic graph.
+            n_variables (int): The number of variables in the graph.
+            maxlags (int): The maximum number of lags.
+            num_samples (int, optional): The number of samples to consider. Defaults to 20.
+            rng (numpy.random.Generator, optional): The generator of the draws. Defaults to the global numpy state.
+
+        Returns:
+            List of (cause, effect, label) triples, label being 1 for causal links and 0 for non-causal links.
+        """
+
+        couples = []
 
         all_possible_links = {
             (i, j)
@@ -224,48 +507,37 @@ class D2C:
 
         if num_samples == -1:
             for parent, child in causal_links:
-                x_y_couples.append(
-                    self.compute_descriptors_for_couple(dag_idx, parent, child, label=1)
-                )  # causal
+                couples.append((parent, child, 1))  # causal
             for node_a, node_b in non_causal_links:
-                x_y_couples.append(
-                    self.compute_descriptors_for_couple(
-                        dag_idx, node_a, node_b, label=0
-                    )
-                )  # noncausal, time ordered
+                couples.append((node_a, node_b, 0))  # noncausal, time ordered
 
             self.test_couples.extend(causal_links)
             self.test_couples.extend(non_causal_links)
 
         else:
+            rng = np.random if rng is None else rng
 
-            subset_causal_links = np.random.permutation(causal_links)[
+            subset_causal_links = rng.permutation(causal_links)[
                 : min(len(causal_links), num_samples)
             ].astype(int)
-            subset_non_causal_links = np.random.permutation(non_causal_links)[
+            subset_non_causal_links = rng.permutation(non_causal_links)[
                 : min(len(non_causal_links), num_samples)
             ].astype(int)
 
             # dag_idx = dag.graph['index']
 
             for parent, child in subset_causal_links:
-                x_y_couples.append(
-                    self.compute_descriptors_for_couple(dag_idx, parent, child, label=1)
-                )  # causal
-                x_y_couples.append(
-                    self.compute_descriptors_for_couple(dag_idx, child, parent, label=0)
+                couples.append((parent, child, 1))  # causal
+                couples.append(
+                    (child, parent, 0)
                 )  # noncausal, not time ordered (yet informative)
             for node_a, node_b in subset_non_causal_links:
-                x_y_couples.append(
-                    self.compute_descriptors_for_couple(
-                        dag_idx, node_a, node_b, label=0
-                    )
-                )  # noncausal, time ordered
+                couples.append((node_a, node_b, 0))  # noncausal, time ordered
 
             self.test_couples.extend(subset_causal_links)
             self.test_couples.extend(subset_non_causal_links)
 
-        return x_y_couples
+        return couples
 
     def get_markov_blanket(self, dag, node):
         """
@@ -290,6 +562,36 @@ class D2C:
 
         return list(set(parents + parents_of_children + children))
 
+    def get_context(self, dag_idx):
+        """
+        Get the SeriesContext of a series: its (standardized) observations, Markov blankets and per-column moments.
+        The couples are processed series after series, so only the context of the last series is kept.
+
+        Args:
+            dag_idx (int): The index of the series.
+
+        Returns:
+            SeriesContext: The context of the series.
+        """
+        if self._context_idx != dag_idx:
+            if self.normalize:
+                observations = self.standardize_data(self.observations[dag_idx])
+            else:
+                observations = self.observations[dag_idx]
+
+            if self.mb_estimator in ("original", "ridge"):
+                markov_blanket_function = self.markov_blanket_estimator.estimate
+            elif self.mb_estimator == "ts":
+                markov_blanket_function = (
+                    self.markov_blanket_estimator.estimate_time_series
+                )
+            elif self.mb_estimator == "mrmr":
+                markov_blanket_function = self.markov_blanket_estimator.estimate_mrmr
+
+            self._context = SeriesContext(observations, markov_blanket_function)
+            self._context_idx = dag_idx
+        return self._context
+
     def standardize_data(self, observations):
         """Standardizes the observation DataFrame."""
         return (observations - observations.mean()) / observations.std()
@@ -354,6 +656,32 @@ class D2C:
         for i, q in enumerate(values):
             dictionary[f"{name}_{i}"] = q
 
+    def estimate_cmi_batch(self, observations, triples):
+        """
+        Estimate the conditional mutual information of many (y, x1, x2) index triples of the same observations,
+        x2 being optional, with the estimator selected by `cmi`.
+
+        Args:
+            observations (numpy.ndarray): The observations.
+            triples (list): The (y, x1, x2) or (y, x1) index triples.
+
+        Returns:
+            numpy.ndarray: The estimate of each triple.
+        """
+        if self.cmi == "original":
+            return self.mutual_information_estimator.estimate_original_batch(
+                observations, triples
+            )
+        return np.array(
+            [
+                self.mutual_information_estimator.estimate_knn_cmi(
+                    observations, *triple
+                )
+                for triple in triples
+            ],
+            dtype=float,
+        )
+
     def compute_descriptors_for_couple(self, dag_idx, ca, ef, label):
         """
         Compute descriptors for a given couple of nodes in a directed acyclic graph (DAG).
@@ -368,24 +696,30 @@ class D2C:
             dict: A dictionary containing the computed descriptors.
 
         """
-        # pq=[0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95]
-        pq = [0.25, 0.5, 0.75]
+        row = self.schema.allocate(1, dtype=self.dtype)[0]
+        self.fill_descriptors(row, dag_idx, ca, ef, label)
+        return self.schema.to_dict(row)
 
-        if self.normalize:
-            observations = self.standardize_data(self.observations[dag_idx])
-        else:
-            observations = self.observations[dag_idx]
-
-        if self.mb_estimator == "original":
-            MBca = self.markov_blanket_estimator.estimate(observations, node=ca)
-            MBef = self.markov_blanket_estimator.estimate(observations, node=ef)
-        elif self.mb_estimator == "ts":
-            MBca = self.markov_blanket_estimator.estimate_time_series(
-                observations, node=ca
-            )
-            MBef = self.markov_blanket_estimator.estimate_time_series(
-                observations, node=ef
-            )
+    def fill_descriptors(self, row, dag_idx, ca, ef, label):
+        """
+        Compute the descriptors of a couple of nodes into a row of the descriptor matrix, laid out by the schema.
+
+        Args:
+            row (numpy.ndarray): The row to fill, initially NaN.
+            dag_idx (int): The index of the DAG.
+            ca (int): The index of the cause node.
+            ef (int): The index of the effect node.
+            label (bool): The label indicating whether the edge between the cause and effect nodes is causal.
+
+        Returns:
+            None
+        """
+        index = self.schema.index
+
+        context = self.get_context(dag_idx)
+        observations = context.observations
+        MBca = context.markov_blanket(ca)
+        MBef = context.markov_blanket(ef)
 
         common_causes = list(set(MBca).intersection(MBef))
         mbca_mbef_couples = [(i, j) for i in range(len(MBca)) for j in range(len(MBef))]
@@ -398,208 +732,109 @@ class D2C:
 
         # e, c = observations[:, ef], observations[:, ca] #aliases 'e' and 'c' for brevity
         e, c = ef, ca
-        if "cmiknn" in self.cmi:
-            CMI = (
-                self.mutual_information_estimator.estimate_knn_cmi
-            )  # alias for mutual information estimator function, for brevity
-        elif self.cmi == "original":
-            CMI = self.mutual_information_estimator.estimate_original
-
-        values = {}
-        values["graph_id"] = dag_idx
-        values["edge_source"] = ca
-        values["edge_dest"] = ef
-        values["is_causal"] = label
+
+        row[index["graph_id"]] = dag_idx
+        row[index["edge_source"]] = ca
+        row[index["edge_dest"]] = ef
+        row[index["is_causal"]] = label
 
         # b: ef = b * (ca + mbef)
-        values["coeff_cause"] = coeff(
+        row[index["coeff_cause"]] = coeff(
             observations[:, e], observations[:, c], observations[:, MBef]
         )
 
         # b: ca = b * (ef + mbca)
-        values["coeff_eff"] = coeff(
+        row[index["coeff_eff"]] = coeff(
             observations[:, c], observations[:, e], observations[:, MBca]
         )
 
-        values["HOC_3_1"] = HOC(observations[:, c], observations[:, e], 3, 1)
-        values["HOC_1_2"] = HOC(observations[:, c], observations[:, e], 1, 2)
-        values["HOC_2_1"] = HOC(observations[:, c], observations[:, e], 2, 1)
-        values["HOC_1_3"] = HOC(observations[:, c], observations[:, e], 1, 3)
+        row[index["HOC_3_1"]] = context.hoc(c, e, 3, 1)
+        row[index["HOC_1_2"]] = context.hoc(c, e, 1, 2)
+        row[index["HOC_2_1"]] = context.hoc(c, e, 2, 1)
+        row[index["HOC_1_3"]] = context.hoc(c, e, 1, 3)
 
-        values["kurtosis_ca"] = kurtosis(observations[:, c])
-        values["kurtosis_ef"] = kurtosis(observations[:, e])
+        row[index["kurtosis_ca"]] = context.kurtosis[c]
+        row[index["kurtosis_ef"]] = context.kurtosis[e]
 
+        # the (y, x1, x2) triples of every family of mutual informations, evaluated together in one batch
+        families = {}
         # I(mca ; mef | cause) for (mca,mef) in mbca_mbef_couples
-        # mca_mef_cau = [0] if not len(mbca_mbef_couples) else [CMI(observations[:,i], observations[:,j], c) for i, j in mbca_mbef_couples]
-        mca_mef_cau = (
-            [0]
-            if not len(mbca_mbef_couples)
-            else [CMI(observations, i, j, c) for i, j in mbca_mbef_couples]
-        )
-        if self.quantiles:
-            self.update_dictionary_quantiles(
-                values, "mca_mef_cau", np.quantile(mca_mef_cau, pq)
-            )
-        else:
-            self.update_dictionary_actual_values(values, "mca_mef_cau", mca_mef_cau)
-
+        families["mca_mef_cau"] = [(i, j, c) for i, j in mbca_mbef_couples]
         # I(mca ; mef| effect) for (mca,mef) in mbca_mbef_couples
-        # mca_mef_eff = [0] if not len(mbca_mbef_couples) else [CMI(observations[:,i], observations[:,j], e) for i, j in mbca_mbef_couples]
-        mca_mef_eff = (
-            [0]
-            if not len(mbca_mbef_couples)
-            else [CMI(observations, i, j, e) for i, j in mbca_mbef_couples]
-        )
-        if self.quantiles:
-            self.update_dictionary_quantiles(
-                values, "mca_mef_eff", np.quantile(mca_mef_eff, pq)
-            )
-        else:
-            self.update_dictionary_actual_values(values, "mca_mef_eff", mca_mef_eff)
-
+        families["mca_mef_eff"] = [(i, j, e) for i, j in mbca_mbef_couples]
         # I(cause; m | effect) for m in MBef
-        # cau_m_eff = [0] if not len(MBef) else [CMI(c, observations[:, m], e) for m in MBef]
-        cau_m_eff = [0] if not len(MBef) else [CMI(observations, c, m, e) for m in MBef]
-        if self.quantiles:
-            self.update_dictionary_quantiles(
-                values, "cau_m_eff", np.quantile(cau_m_eff, pq)
-            )
-        else:
-            self.update_dictionary_actual_values(values, "cau_m_eff", cau_m_eff)
-
+        families["cau_m_eff"] = [(c, m, e) for m in MBef]
         # I(effect; m | cause) for m in MBca
-        # eff_m_cau = [0] if not len(MBca) else [CMI(e, observations[:, m], c) for m in MBca]
-        eff_m_cau = [0] if not len(MBca) else [CMI(observations, e, m, c) for m in MBca]
-        if self.quantiles:
-            self.update_dictionary_quantiles(
-                values, "eff_m_cau", np.quantile(eff_m_cau, pq)
-            )
-        else:
-            self.update_dictionary_actual_values(values, "eff_m_cau", eff_m_cau)
+        families["eff_m_cau"] = [(e, m, c) for m in MBca]
 
         if self.full:
-
             # I(m; cause) for m in MBef
-            # m_cau = [0] if not len(MBef) else [CMI(c, observations[:, m]) for m in MBef]
-            m_cau = [0] if not len(MBef) else [CMI(observations, c, m) for m in MBef]
-            if self.quantiles:
-                self.update_dictionary_quantiles(
-                    values, "m_cau", np.quantile(m_cau, pq)
-                )
-            else:
-                self.update_dictionary_actual_values(values, "m_cau", m_cau)
-
+            families["m_cau"] = [(c, m) for m in MBef]
             # I(cause; effect | common_causes)
-            # values['com_cau'] = CMI(e, c, observations[:, common_causes])
-            values["com_cau"] = CMI(observations, e, c, common_causes)
-
+            families["com_cau"] = [(e, c, common_causes)]
             # I(cause; effect)
-            # values['cau_eff'] = CMI(e, c)
-            values["cau_eff"] = CMI(observations, e, c)
-
+            families["cau_eff"] = [(e, c)]
             # I(effect; cause)
-            # values['eff_cau'] = CMI(c, e)
-            values["eff_cau"] = CMI(observations, c, e)
-
+            families["eff_cau"] = [(c, e)]
             # I(effect; cause | MBeffect)
-            # values['eff_cau_mbeff'] = CMI(c, e, observations[:, MBef])
-            values["eff_cau_mbeff"] = CMI(observations, c, e, MBef)
-
+            families["eff_cau_mbeff"] = [(c, e, MBef)]
             # I(cause; effect | MBcause)
-            # values['cau_eff_mbcau'] = CMI(e, c, observations[:, MBca])
-            values["cau_eff_mbcau"] = CMI(observations, e, c, MBca)
-
+            families["cau_eff_mbcau"] = [(e, c, MBca)]
             # I(effect; cause | arrays_m_plus_MBca)
-            # eff_cau_mbcau_plus = [0] if not len(MBef) else [CMI(c, e, observations[:,np.unique(np.concatenate(([m], MBca)))]) for m in MBef]
-            eff_cau_mbcau_plus = (
-                [0]
-                if not len(MBef)
-                else [
-                    CMI(observations, c, e, np.unique(np.concatenate(([m], MBca))))
-                    for m in MBef
-                ]
-            )
-            if self.quantiles:
-                self.update_dictionary_quantiles(
-                    values, "eff_cau_mbcau_plus", np.quantile(eff_cau_mbcau_plus, pq)
-                )
-            else:
-                self.update_dictionary_actual_values(
-                    values, "eff_cau_mbcau_plus", eff_cau_mbcau_plus
-                )
-
+            families["eff_cau_mbcau_plus"] = [
+                (c, e, np.unique(np.concatenate(([m], MBca)))) for m in MBef
+            ]
             # I(cause; effect | arrays_m_plus_MBef)
-            # cau_eff_mbeff_plus = [0] if not len(MBca) else [CMI(e, c, observations[:,np.unique(np.concatenate(([m], MBef)))]) for m in MBca]
-            cau_eff_mbeff_plus = (
-                [0]
-                if not len(MBca)
-                else [
-                    CMI(observations, e, c, np.unique(np.concatenate(([m], MBef))))
-                    for m in MBca
-                ]
-            )
-            if self.quantiles:
-                self.update_dictionary_quantiles(
-                    values, "cau_eff_mbeff_plus", np.quantile(cau_eff_mbeff_plus, pq)
-                )
-            else:
-                self.update_dictionary_actual_values(
-                    values, "cau_eff_mbeff_plus", cau_eff_mbeff_plus
-                )
-
+            families["cau_eff_mbeff_plus"] = [
+                (e, c, np.unique(np.concatenate(([m], MBef)))) for m in MBca
+            ]
             # I(m; effect) for m in MBca
-            # m_eff = [0] if not len(MBca) else [CMI(e, observations[:, m]) for m in MBca]
-            m_eff = [0] if not len(MBca) else [CMI(observations, e, m) for m in MBca]
-            if self.quantiles:
-                self.update_dictionary_quantiles(
-                    values, "m_eff", np.quantile(m_eff, pq)
-                )
-            else:
-                self.update_dictionary_actual_values(values, "m_eff", m_eff)
-
+            families["m_eff"] = [(e, m) for m in MBca]
             # I(mca ; mca| cause) - I(mca ; mca) for (mca,mca) in mbca_couples
-            # mca_mca_cau = [0] if not len(mbca_mbca_couples) else [CMI(observations[:,i], observations[:,j], c) - CMI(observations[:,i], observations[:,j]) for i, j in mbca_mbca_couples]
-            mca_mca_cau = (
-                [0]
-                if not len(mbca_mbca_couples)
-                else [
-                    CMI(observations, i, j, c) - CMI(observations, i, j)
-                    for i, j in mbca_mbca_couples
-                ]
-            )
-            if self.quantiles:
-                self.update_dictionary_quantiles(
-                    values, "mca_mca_cau", np.quantile(mca_mca_cau, pq)
-                )
-            else:
-                self.update_dictionary_actual_values(values, "mca_mca_cau", mca_mca_cau)
-
+            families["mca_mca_cau"] = [(i, j, c) for i, j in mbca_mbca_couples]
+            families["mca_mca"] = [(i, j) for i, j in mbca_mbca_couples]
             # I(mbe ; mbe| effect) - I(mbe ; mbe) for (mbe,mbe) in mbef_couples
-            # mbe_mbe_eff = [0] if not len(mbef_mbef_couples) else [CMI(observations[:,i], observations[:,j], e) - CMI(observations[:,i], observations[:,j]) for i, j in mbef_mbef_couples]
-            mbe_mbe_eff = (
-                [0]
-                if not len(mbef_mbef_couples)
-                else [
-                    CMI(observations, i, j, e) - CMI(observations, i, j)
-                    for i, j in mbef_mbef_couples
-                ]
+            families["mbe_mbe_eff"] = [(i, j, e) for i, j in mbef_mbef_couples]
+            families["mbe_mbe"] = [(i, j) for i, j in mbef_mbef_couples]
+
+        estimates = self.estimate_cmi_batch(
+            observations,
+            [triple for triples in families.values() for triple in triples],
+        )
+        start = 0
+        for name, triples in families.items():
+            families[name] = estimates[start : start + len(triples)]
+            start += len(triples)
+
+        for name in ["mca_mef_cau", "mca_mef_eff", "cau_m_eff", "eff_m_cau"]:
+            self.schema.fill_family(row, name, families[name])
+
+        if self.full:
+            self.schema.fill_family(row, "m_cau", families["m_cau"])
+            for name in [
+                "com_cau",
+                "cau_eff",
+                "eff_cau",
+                "eff_cau_mbeff",
+                "cau_eff_mbcau",
+            ]:
+                row[index[name]] = families[name][0]
+            for name in ["eff_cau_mbcau_plus", "cau_eff_mbeff_plus", "m_eff"]:
+                self.schema.fill_family(row, name, families[name])
+            self.schema.fill_family(
+                row, "mca_mca_cau", families["mca_mca_cau"] - families["mca_mca"]
+            )
+            self.schema.fill_family(
+                row, "mbe_mbe_eff", families["mbe_mbe_eff"] - families["mbe_mbe"]
             )
-            if self.quantiles:
-                self.update_dictionary_quantiles(
-                    values, "mbe_mbe_eff", np.quantile(mbe_mbe_eff, pq)
-                )
-            else:
-                self.update_dictionary_actual_values(values, "mbe_mbe_eff", mbe_mbe_eff)
 
-            values["n_samples"] = observations.shape[0]
-            values["n_features"] = observations.shape[1]
-            values["n_features/n_samples"] = (
+            row[index["n_samples"]] = observations.shape[0]
+            row[index["n_features"]] = observations.shape[1]
+            row[index["n_features/n_samples"]] = (
                 observations.shape[1] / observations.shape[0]
             )
-            values["skewness_ca"] = skew(observations[:, c])
-            values["skewness_ef"] = skew(observations[:, e])
-
-        return values
+            row[index["skewness_ca"]] = context.skewness[c]
+            row[index["skewness_ef"]] = context.skewness[e]
 
     def get_descriptors_df(self) -> pd.DataFrame:
         """
@@ -609,7 +844,16 @@ class D2C:
             pd.DataFrame: The concatenated DataFrame of X and Y.
 
         """
-        return pd.DataFrame(self.x_y)
+        if self.x_y is None and self.output_dir is not None:
+            shards = [
+                descriptors for _, descriptors in read_descriptor_shards(self.output_dir)
+            ]
+            return self.schema.to_frame(
+                np.concatenate(shards)
+                if shards
+                else self.schema.allocate(0, dtype=self.dtype)
+            )
+        return self.schema.to_frame(self.x_y)
 
     def get_test_couples(self):
         return self.test_couples
@@ -0,0 +1,177 @@
+"""
+This module contains a columnar, memory-mapped dataset format for the DataLoader.
+
+A dataset is a directory holding:
+- observations.bin: all the observations, as one contiguous C-ordered float64 array of shape (total rows, n_variables);
+- offsets.npy: the first row of each series in observations.bin, plus the total number of rows;
+- edges.npy: the edges of all the DAGs, as (source, target) couples of integer nodes, x_(t-y) being x + y*n_variables;
+- edge_offsets.npy: the first edge of each DAG in edges.npy, plus the total number of edges;
+- dataset.json: the number of variables, the maximum lag of the DAGs and the sizes of the tables.
+
+Everything is opened with np.memmap, so opening a dataset does not read the observations,
+and reading a series by index only touches its own rows.
+"""
+
+import json
+import os
+from collections.abc import Sequence
+
+import numpy as np
+import networkx as nx
+
+METADATA_FILE = "dataset.json"
+OBSERVATIONS_FILE = "observations.bin"
+
+
+def write_dataset(path, observations, dags, n_variables):
+    """
+    Writes a dataset, appending the series one after the other, so that the input can be a generator.
+
+    Parameters:
+    - path (str): The directory of the dataset.
+    - observations (iterable): The time series, as arrays of shape (rows, n_variables).
+    - dags (iterable): The corresponding DAGs, with nodes named as x_t-y.
+    - n_variables (int): The number of variables in the data.
+    """
+    os.makedirs(path, exist_ok=True)
+    offsets = [0]
+    edges = []
+    edge_offsets = [0]
+    dag_maxlags = 0
+    with open(os.path.join(path, OBSERVATIONS_FILE), "wb") as f:
+        for obs, dag in zip(observations, dags):
+            obs = np.ascontiguousarray(obs, dtype=np.float64)
+            f.write(obs.tobytes())
+            offsets.append(offsets[-1] + obs.shape[0])
+            edges.extend(
+                (_node_to_int(source, n_variables), _node_to_int(target, n_variables))
+                for source, target in dag.edges
+            )
+            edge_offsets.append(len(edges))
+            dag_maxlags = max(
+                [dag_maxlags] + [int(node.split("-")[1]) for node in dag.nodes]
+            )
+
+    np.save(os.path.join(path, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    np.save(
+        os.path.join(path, "edges.npy"),
+        np.array(edges, dtype=np.int64).reshape(-1, 2),
+    )
+    np.save(
+        os.path.join(path, "edge_offsets.npy"), np.array(edge_offsets, dtype=np.int64)
+    )
+    with open(os.path.join(path, METADATA_FILE), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "n_variables": n_variables,
+                "dag_maxlags": dag_maxlags,
+                "n_series": len(offsets) - 1,
+                "n_rows": offsets[-1],
+                "n_edges": len(edges),
+            },
+            f,
+        )
+
+
+def open_dataset(path):
+    """
+    Opens a dataset without reading it.
+
+    Parameters:
+    - path (str): The directory of the dataset.
+
+    Returns:
+    - observations (MemmapObservations): The time series, read on access.
+    - dags (MemmapDags): The DAGs, built on access.
+    - metadata (dict): The content of dataset.json.
+    """
+    with open(os.path.join(path, METADATA_FILE), "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+    edge_offsets = np.load(os.path.join(path, "edge_offsets.npy"), mmap_mode="r")
+    edges = np.load(os.path.join(path, "edges.npy"), mmap_mode="r")
+
+    if metadata["n_rows"] > 0:
+        data = np.memmap(
+            os.path.join(path, OBSERVATIONS_FILE),
+            dtype=np.float64,
+            mode="r",
+            shape=(metadata["n_rows"], metadata["n_variables"]),
+        )
+    else:  # np.memmap cannot map an empty file
+        data = np.empty((0, metadata["n_variables"]))
+
+    observations = MemmapObservations(data, offsets)
+    dags = MemmapDags(
+        edges, edge_offsets, metadata["n_variables"], metadata["dag_maxlags"]
+    )
+    return observations, dags, metadata
+
+
+class MemmapObservations(Sequence):
+    """
+    Read-only list of the time series of a dataset. Each item is a view on the memory-mapped observations.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("series index out of range")
+        return self.data[self.offsets[index] : self.offsets[index + 1]]
+
+
+class MemmapDags(Sequence):
+    """
+    Read-only list of the DAGs of a dataset. Each item is built from the edge table on access,
+    with the nodes named and ordered as in the DAGs of the TSBuilder.
+    """
+
+    def __init__(self, edges, edge_offsets, n_variables, maxlags):
+        self.edges = edges
+        self.edge_offsets = edge_offsets
+        self.n_variables = n_variables
+        self.maxlags = maxlags
+
+    def __len__(self):
+        return len(self.edge_offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("DAG index out of range")
+
+        dag = nx.DiGraph()
+        # every node is present, even without edges, from the oldest lag to the present
+        dag.add_nodes_from(
+            f"{j}_t-{lag}"
+            for lag in range(self.maxlags, -1, -1)
+            for j in range(self.n_variables)
+        )
+        dag.add_edges_from(
+            (self._int_to_node(source), self._int_to_node(target))
+            for source, target in self.edges[
+                self.edge_offsets[index] : self.edge_offsets[index + 1]
+            ]
+        )
+        return dag
+
+    def _int_to_node(self, node):
+        return f"{node % self.n_variables}_t-{node // self.n_variables}"
+
+
+def _node_to_int(node, n_variables):
+    # from x_(t-y) to x + y*n_variables, as in DataLoader._rename_dags
+    return int(node.split("_")[0]) + int(node.split("-")[1]) * n_variables
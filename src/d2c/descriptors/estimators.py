@@ -1,21 +1,23 @@
 """
 This module contains a MarkovBlanketEstimator and a MutualInformationEstimator. 
 """
-import numpy as np
+import hashlib
+from collections import OrderedDict
 
-from cachetools import cached, Cache
-from cachetools.keys import hashkey
+import numpy as np
 
 from sklearn.linear_model import Ridge, RidgeCV
 from sklearn.model_selection import cross_val_score
+from scipy.spatial import cKDTree
+from scipy.special import digamma
 from scipy.stats import pearsonr
+from sklearn.feature_selection import mutual_info_regression
 
 from sklearn.base import BaseEstimator, RegressorMixin
-import time
 
 
 class MarkovBlanketEstimator:
-    def __init__(self, size=5, n_variables=5, maxlags=5, verbose=True):
+    def __init__(self, size=5, n_variables=5, maxlags=5, verbose=True, engine='matrix'):
         """
         Initializes the Markov Blanket Estimator with specified parameters.
         
@@ -24,11 +26,20 @@ class MarkovBlanketEstimator:
         - size (int): The desired size of the Markov Blanket.
         - n_variables (int): The number of variables in the dataset.
         - maxlags (int): The maximum number of lags to consider in the time series analysis.
+        - engine (str): How estimate ranks the candidates: 'matrix' computes the correlation matrix of a dataset once
+          and ranks the candidates of every node from it, 'ridge' ranks them by the absolute coefficients of the
+          RidgeCV regressions of all the nodes, computed together (see regression_importances),
+          'pearsonr' calls scipy's pearsonr per column and per node.
         """
         self.verbose = verbose
         self.size = size
         self.n_variables = n_variables
         self.maxlags = maxlags
+        self.engine = engine
+        self._ranked_dataset = None
+        self._blankets = None
+        self._mi_dataset = None
+        self._mi_matrix = None
 
     def column_based_correlation(self, X, Y):
         """
@@ -69,9 +80,93 @@ class MarkovBlanketEstimator:
         
         return ranked_indices
 
+    def correlation_matrix(self, dataset):
+        """
+        Computes the Pearson correlation coefficients between all the columns of the dataset, as one product of
+        the standardized columns. The coefficients of a constant column are NaN.
+        
+        Parameters:
+        - dataset (numpy.ndarray): The dataset.
+        
+        Returns:
+        - numpy.ndarray: The (n_columns, n_columns) correlation matrix.
+        """
+        centered = np.asarray(dataset, dtype=float)
+        centered = centered - centered.mean(axis=0)
+        norms = np.sqrt(np.einsum('ij,ij->j', centered, centered))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            standardized = centered / norms
+        return standardized.T @ standardized
+
+    def regression_importances(self, dataset, alphas=(0.1, 1.0, 10.0)):
+        """
+        Computes, for every node, the absolute coefficients of the ridge regression of the node on all the other columns,
+        with the regularization chosen among alphas by leave-one-out error, as RidgeCV(alphas).fit does node by node.
+
+        All the regressions come from one eigendecomposition of the centered Gram matrix G = V diag(l) V^T.
+        For each alpha, with M = (G + alpha I)^-1 = V diag(1 / (l + alpha)) V^T and U = X M:
+        - the coefficients of node j on the others are -M[:, j] / M[j, j];
+        - its in-sample residuals are U[:, j] / M[j, j];
+        - the diagonal of its hat matrix is diag(X M X^T) - U[:, j]**2 / M[j, j], plus 1/n for the intercept.
+        
+        Parameters:
+        - dataset (numpy.ndarray): The dataset.
+        - alphas (tuple): The candidate regularizations, as in RidgeCV.
+        
+        Returns:
+        - numpy.ndarray: The (n_columns, n_columns) matrix, whose row j holds the importance of each column for node j,
+          with a zero diagonal.
+        """
+        X = np.asarray(dataset, dtype=float)
+        X = X - X.mean(axis=0)
+        n = X.shape[0]
+        eigenvalues, V = np.linalg.eigh(X.T @ X)
+        XV = X @ V
+
+        best_errors = np.full(X.shape[1], np.inf)
+        importances = np.zeros((X.shape[1], X.shape[1]))
+        for alpha in alphas:
+            inverse = 1 / (eigenvalues + alpha)
+            M = (V * inverse) @ V.T
+            U = X @ M
+            diagonal = np.diag(M)
+            hat = np.einsum('ik,k,ik->i', XV, inverse, XV)[:, None] - U ** 2 / diagonal + 1 / n
+            errors = np.mean((U / diagonal / (1 - hat)) ** 2, axis=0)
+            better = errors < best_errors
+            best_errors[better] = errors[better]
+            importances[better] = np.abs(M[:, better] / diagonal[better]).T
+        np.fill_diagonal(importances, 0)
+        return importances
+
+    def rank_all(self, dataset):
+        """
+        Estimates the Markov Blanket of every node of the dataset at once: the `size` other columns the most correlated
+        with the node, in absolute value, from the most to the least correlated. Constant columns are ranked last.
+        With the 'ridge' engine, the columns are ranked by their regression importances instead.
+        
+        Parameters:
+        - dataset (numpy.ndarray): The dataset containing all variables.
+        
+        Returns:
+        - numpy.ndarray: The (n_columns, size) indices of the Markov Blanket of each node.
+        """
+        if self.engine == 'ridge':
+            scores = self.regression_importances(dataset)
+        else:
+            scores = np.nan_to_num(np.abs(self.correlation_matrix(dataset)), nan=-1.0)
+        np.fill_diagonal(scores, -np.inf)  # a node is not in its own Markov Blanket
+        size = min(self.size, scores.shape[0] - 1)
+        if size <= 0:
+            return np.empty((scores.shape[0], 0), dtype=int)
+        top = np.argpartition(-scores, size - 1, axis=1)[:, :size]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(top, order, axis=1)
+
     def estimate(self, dataset, node):
         """
         Estimates the Markov Blanket for a given node using feature ranking.
+        With the 'matrix' and 'ridge' engines, the Markov Blankets of all the nodes are estimated on the first call on a dataset,
+        and the next calls on the same array are lookups.
         
         Parameters:
         - dataset (numpy.ndarray): The dataset containing all variables.
@@ -81,6 +176,12 @@ class MarkovBlanketEstimator:
         Returns:
         - numpy.ndarray: Indices of the variables in the estimated Markov Blanket.
         """
+        if self.engine in ('matrix', 'ridge'):
+            if dataset is not self._ranked_dataset:
+                self._blankets = self.rank_all(dataset)
+                self._ranked_dataset = dataset
+            return self._blankets[node]
+
         n = dataset.shape[1]
         candidates_positions = np.array(list(set(range(n)) - {node}))
         Y = dataset[:, node]
@@ -93,6 +194,58 @@ class MarkovBlanketEstimator:
         
         return sorted_ind[:self.size]
     
+    def mutual_information_matrix(self, dataset):
+        """
+        Estimates the mutual information between all the couples of columns of the dataset with mutual_info_regression,
+        each couple once. The estimates are made deterministic with a fixed random state.
+        
+        Parameters:
+        - dataset (numpy.ndarray): The dataset.
+        
+        Returns:
+        - numpy.ndarray: The symmetric (n_columns, n_columns) mutual information matrix, with a zero diagonal.
+        """
+        dataset = np.asarray(dataset, dtype=float)
+        n = dataset.shape[1]
+        mi = np.zeros((n, n))
+        for j in range(n - 1):
+            mi[j, j + 1:] = mutual_info_regression(dataset[:, j + 1:], dataset[:, j], random_state=0)
+        return mi + mi.T
+
+    def estimate_mrmr(self, dataset, node):
+        """
+        Estimates the Markov Blanket of a node by Max-Relevance Min-Redundancy selection: at each step, the candidate with the
+        highest mutual information with the node minus its mean mutual information with the already selected ones.
+        
+        The pairwise mutual informations are estimated once per dataset and shared by the searches of all the nodes,
+        and the redundancy of each candidate is a running sum, so a step only adds the terms of the last selected feature.
+        
+        Parameters:
+        - dataset (numpy.ndarray): The dataset containing all variables.
+        - node (int): The index of the target node for which to estimate the Markov Blanket.
+        
+        Returns:
+        - numpy.ndarray: Indices of the variables in the estimated Markov Blanket, in the order they were selected.
+        """
+        if dataset is not self._mi_dataset:
+            self._mi_matrix = self.mutual_information_matrix(dataset)
+            self._mi_dataset = dataset
+        mi = self._mi_matrix
+
+        candidates = np.array([i for i in range(mi.shape[0]) if i != node], dtype=int)
+        relevance = mi[candidates, node]
+        redundancy = np.zeros(len(candidates))
+        available = np.ones(len(candidates), dtype=bool)
+        selected = []
+        for step in range(min(self.size, len(candidates))):
+            scores = relevance - redundancy / step if step else relevance.copy()
+            scores[~available] = -np.inf
+            best = np.argmax(scores)
+            selected.append(candidates[best])
+            available[best] = False
+            redundancy += mi[candidates, candidates[best]]
+        return np.array(selected, dtype=int)
+
     def estimate_time_series(self, dataset, node):
         '''
         The idea is to leverage the fact that we are in a temporal context and we know that x_t-1 is in the markov blanked of x_t. As well as x_t+1. 
@@ -111,17 +264,84 @@ class MarkovBlanketEstimator:
         # make mb type int
         return mb.astype(int)
     
-cache = Cache(maxsize=1024)  # Define cache size
+class MSECache:
+    """
+    LRU cache of MSEs, keyed by (dataset_id, y_index, sorted x_indices, cv), so that a lookup never touches the data.
+
+    An optional `shared` mapping, such as a multiprocessing.Manager().dict() handed to every worker, is consulted
+    on local misses and filled with every computed value, so that the workers reuse each other's results.
+    The shared mapping is not bounded.
+    """
 
-def custom_hashkey(*args, **kwargs):
-    return hashkey(*(
-        (arg.data.tobytes(), arg.shape) if isinstance(arg, np.ndarray) else arg
-        for arg in args
-    ), **kwargs)
+    def __init__(self, maxsize=4096, shared=None):
+        """
+        Parameters:
+        - maxsize (int): The maximum number of entries kept locally.
+        - shared (MutableMapping): A mapping shared between processes, or None.
+        """
+        self.maxsize = maxsize
+        self.shared = shared
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(dataset_id, y_index, x_index, cv):
+        return (dataset_id, int(y_index), tuple(sorted(int(i) for i in np.atleast_1d(x_index))), cv)
 
+    def get(self, key):
+        """
+        Returns the cached MSE, or None on a miss.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.hits += 1
+                self._store(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._store(key, value)
+        if self.shared is not None:
+            self.shared[key] = value
+
+    def _store(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Returns the number of hits, misses, the hit rate and the number of local entries.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'size': len(self.entries)}
 
-@cached(cache, key=custom_hashkey)
-def mse(X, y, cv):
+
+def dataset_fingerprint(dataset):
+    """
+    Identifies a dataset by its content, so that the identifier is the same in every process.
+    """
+    dataset = np.ascontiguousarray(dataset)
+    digest = hashlib.blake2b(dataset.tobytes(), digest_size=16)
+    digest.update(str((dataset.shape, dataset.dtype.str)).encode())
+    return digest.hexdigest()
+
+
+def mse(X, y, cv, model=None):
     """
     Calculates the mean squared error (MSE) based on the prediction of Y from X using the specified regression model.
     The MSE is a proxy for the conditional entropy of Y given X. Higher MSE means higher uncertainty, therefore higher entropy.
@@ -131,6 +351,7 @@ def mse(X, y, cv):
     - X (numpy.ndarray): The feature matrix.
     - Y (numpy.ndarray): The target vector.
     - cv (int): The number of cross-validation folds to use.
+    - model (estimator): The regression model, Ridge(alpha=1e-3) by default.
 
     Returns:
     - float: The MSE of the prediction.
@@ -138,25 +359,131 @@ def mse(X, y, cv):
     X = X[:, np.newaxis] if X.ndim == 1 else X
     y = y[:, np.newaxis] if y.ndim == 1 else y
 
-    # model = self.get_regression_model()
-    neg_mean_squared_error_folds = cross_val_score(Ridge(alpha=1e-3), X, y, scoring='neg_mean_squared_error', cv=cv)
+    model = Ridge(alpha=1e-3) if model is None else model
+    neg_mean_squared_error_folds = cross_val_score(model, X, y, scoring='neg_mean_squared_error', cv=cv)
     return max(1e-3, -np.mean(neg_mean_squared_error_folds)) #we set 0.001 as a lower bound
 
-  
+
+
+class RidgeMSE:
+    """
+    Closed-form equivalent of `mse` for any subset of the columns of one dataset.
+
+    The rows are split in `cv` contiguous folds, as KFold does in cross_val_score. For each fold, the mean and
+    the centered scatter matrix of all the columns are computed once. A ridge fit on the training folds and its
+    test error on the held-out fold then only need sub-blocks of these statistics, so no estimator is fitted on raw rows.
+    The results match `mse` up to floating-point rounding.
+    """
+
+    def __init__(self, dataset, cv=2, alpha=1e-3):
+        """
+        Parameters:
+        - dataset (numpy.ndarray): The dataset, of shape (n_samples, n_columns).
+        - cv (int): The number of cross-validation folds to use.
+        - alpha (float): The regularization strength of the ridge regression.
+        """
+        self.dataset = dataset
+        self.cv = cv
+        self.alpha = alpha
+
+        data = np.asarray(dataset, dtype=float)
+        n_samples = data.shape[0]
+        fold_sizes = np.full(cv, n_samples // cv)
+        fold_sizes[: n_samples % cv] += 1
+        bounds = np.concatenate(([0], np.cumsum(fold_sizes)))
+
+        self.counts = fold_sizes
+        self.means = []
+        self.scatters = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            fold = data[start:stop]
+            mean = fold.mean(axis=0)
+            centered = fold - mean
+            self.means.append(mean)
+            self.scatters.append(centered.T @ centered)
+
+        # statistics of the training set of each split, pooled from the other folds
+        self.train_means = []
+        self.train_scatters = []
+        for k in range(cv):
+            others = [l for l in range(cv) if l != k]
+            n_train = sum(self.counts[l] for l in others)
+            mean = sum(self.counts[l] * self.means[l] for l in others) / n_train
+            scatter = sum(self.scatters[l] for l in others)
+            for l in others:
+                shift = self.means[l] - mean
+                scatter = scatter + self.counts[l] * np.outer(shift, shift)
+            self.train_means.append(mean)
+            self.train_scatters.append(scatter)
+
+    def __call__(self, x_index, y_index):
+        """
+        Returns the cross-validated MSE of the prediction of column y_index from the columns x_index, as `mse` does.
+        """
+        return self.batch([(x_index, y_index)])[0]
+
+    def batch(self, subproblems):
+        """
+        Returns the cross-validated MSEs of many (x_index, y_index) subproblems.
+        The subproblems with the same number of predictors are solved together, as one stack of linear systems.
+        The predictors are sorted first, so the result does not depend on their order.
+        """
+        results = np.empty(len(subproblems))
+        by_size = {}
+        for position, (x_index, _) in enumerate(subproblems):
+            by_size.setdefault(np.size(x_index), []).append(position)
+
+        for size, positions in by_size.items():
+            X = np.sort(np.array([np.atleast_1d(subproblems[p][0]) for p in positions], dtype=int).reshape(len(positions), size), axis=1)
+            Y = np.array([subproblems[p][1] for p in positions], dtype=int)
+            errors = np.zeros(len(positions))
+            for k in range(self.cv):
+                S, m = self.train_scatters[k], self.train_means[k]
+                S_test, m_test, n_test = self.scatters[k], self.means[k], self.counts[k]
+
+                # ridge on centered training data: (Xc'Xc + alpha I) w = Xc'yc, intercept m[y] - m[x]w
+                A = S[X[:, :, None], X[:, None, :]] + self.alpha * np.eye(size)
+                w = np.linalg.solve(A, S[X, Y[:, None]][..., None])[..., 0]
+                # the residuals on the test fold, around their own mean, plus the shift between the fold means
+                shift = m_test[Y] - m[Y] - np.einsum('bi,bi->b', m_test[X] - m[X], w)
+                squared_error = (S_test[Y, Y] - 2 * np.einsum('bi,bi->b', w, S_test[X, Y[:, None]])
+                                 + np.einsum('bi,bij,bj->b', w, S_test[X[:, :, None], X[:, None, :]], w)
+                                 + n_test * shift ** 2)
+                errors += squared_error / n_test
+            results[positions] = np.maximum(1e-3, errors / self.cv) #we set 0.001 as a lower bound
+        return results
+
 
 class MutualInformationEstimator: 
 
-    def __init__(self, proxy='Ridge', proxy_params=None, k=3):
+    def __init__(self, proxy='Ridge', proxy_params=None, k=3, mse_engine='gram', mse_cache=None):
         """
         Initializes the Mutual Information Estimator with specified regression proxy and parameters.
         
         Parameters:
         - proxy (str): The name of the regression model to use ('Ridge' by default).
         - proxy_params (dict): Parameters for the regression model.
+        - mse_engine (str): How estimate_original computes the MSEs: 'gram' uses a RidgeMSE built once per dataset,
+          'sklearn' fits the models with `mse`. Both give the same results up to floating-point rounding.
+          With a proxy other than 'Ridge', the proxy models are always fitted with `mse`.
+        - mse_cache (MSECache): The cache of the MSEs. Defaults to a new local MSECache.
         """
         self.proxy = proxy
         self.proxy_params = proxy_params or {}
         self.k = k
+        self.mse_engine = mse_engine
+        self._ridge_mse = None
+        self.mse_cache = MSECache() if mse_cache is None else mse_cache
+        self._fingerprinted = None
+        self._fingerprint = None
+        # memo of the CMIs of the current dataset, so the couples of a series share their common terms
+        self._cmi_memo = {}
+        self._cmi_memo_id = None
+        self.cmi_hits = 0
+        self.cmi_misses = 0
+        # KD-trees of the column subsets of the current dataset, for the kNN estimator
+        self._trees = {}
+        self._tree_dataset = None
 
     def get_regression_model(self):
         """
@@ -170,13 +497,78 @@ class MutualInformationEstimator:
             model = Ridge(alpha=alpha)
         elif self.proxy == 'LOWESS':
             tau = self.proxy_params.get('tau', 0.5)
-            model = LOWESS(tau=tau)
+            model = LOWESS(tau=tau, n_neighbors=self.proxy_params.get('n_neighbors'))
         elif self.proxy == 'RF':
             raise NotImplementedError("Random Forest is not yet supported as a proxy model.")
         else: #TODO: Implement other regression models here based on the proxy value.
             raise ValueError(f"Unsupported proxy model: {self.proxy}")
         return model
     
+    def _mse(self, dataset, x_index, y_index, cv):
+        """
+        MSE of the prediction of column y_index from the columns x_index of the dataset.
+        The RidgeMSE of the last dataset is kept, so the couples of a series share it as long as they pass the same array.
+        """
+        key = self.mse_cache.key(self._dataset_id(dataset), y_index, x_index, cv)
+        value = self.mse_cache.get(key)
+        if value is None:
+            if self.proxy != 'Ridge':
+                value = mse(dataset[:, x_index], dataset[:, y_index], cv=cv, model=self.get_regression_model())
+            elif self.mse_engine == 'sklearn':
+                value = mse(dataset[:, x_index], dataset[:, y_index], cv=cv)
+            else:
+                value = self._get_ridge_mse(dataset, cv)(x_index, y_index)
+            self.mse_cache.put(key, value)
+        return value
+
+    def _dataset_id(self, dataset):
+        """
+        Fingerprint of the dataset, computed once for as long as the same array is passed.
+        """
+        if dataset is not self._fingerprinted:
+            self._fingerprinted = dataset
+            self._fingerprint = dataset_fingerprint(dataset)
+        return self._fingerprint
+
+    def _memo(self, dataset):
+        """
+        The CMI memo table of the dataset. It is emptied whenever another dataset comes, so it holds one series at a time.
+        """
+        dataset_id = self._dataset_id(dataset)
+        if dataset_id != self._cmi_memo_id:
+            self._cmi_memo = {}
+            self._cmi_memo_id = dataset_id
+        return self._cmi_memo
+
+    @staticmethod
+    def _cmi_key(method, y_index, x1_index, x2_index, param):
+        # the estimates do not depend on the order of the columns within x1 and within x2
+        canonical = lambda index: () if index is None else tuple(sorted(int(i) for i in np.atleast_1d(index)))
+        return (method, int(y_index), canonical(x1_index), canonical(x2_index), param)
+
+    def _memo_get(self, memo, key):
+        if key in memo:
+            self.cmi_hits += 1
+            return memo[key]
+        self.cmi_misses += 1
+        return None
+
+    def reuse_stats(self):
+        """
+        Returns how often the CMIs and the MSEs were reused instead of being estimated again.
+        """
+        lookups = self.cmi_hits + self.cmi_misses
+        return {
+            'cmi': {'hits': self.cmi_hits, 'misses': self.cmi_misses,
+                    'reuse_rate': self.cmi_hits / lookups if lookups else 0.0, 'size': len(self._cmi_memo)},
+            'mse': self.mse_cache.stats(),
+        }
+
+    def _get_ridge_mse(self, dataset, cv):
+        if self._ridge_mse is None or self._ridge_mse.dataset is not dataset or self._ridge_mse.cv != cv:
+            self._ridge_mse = RidgeMSE(dataset, cv=cv)
+        return self._ridge_mse
+
     def estimate_original(self, dataset, y_index, x1_index, x2_index = None, cv=2):
         """
         Estimates the (normalized) conditional mutual information of x1 to y given x2. 
@@ -207,106 +599,235 @@ class MutualInformationEstimator:
         Returns:
         - float: The estimated conditional mutual information.
         """
-
-        y = dataset[:, y_index]
-        x1 = dataset[:, x1_index]
-        x2 = None if x2_index is None else dataset[:, x2_index]
+        memo = self._memo(dataset)
+        key = self._cmi_key('original', y_index, x1_index, x2_index, cv)
+        mutual_information = self._memo_get(memo, key)
+        if mutual_information is None:
+            mutual_information = memo[key] = self._estimate_original(dataset, y_index, x1_index, x2_index, cv)
+        return mutual_information
+
+    def _estimate_original(self, dataset, y_index, x1_index, x2_index, cv):
+        # the columns are selected by index, so that the MSEs can be computed from per-dataset statistics
+        n_samples = dataset.shape[0]
+        x1_index = np.atleast_1d(x1_index)
+        x2_index = None if x2_index is None else np.atleast_1d(x2_index)
 
         
-        if x2 is None or x2.size == 0:  #- I(x1; y) ≈ (H(y) − H(y|x1))/H(y)= 1 - MSE(x1,y) / Var(y)
-            entropy_y = max(1e-3, np.var(y)) #we set 0.001 as a lower bound
-            entropy_y_given_x1 = mse(x1, y, cv=cv) 
+        if x2_index is None or x2_index.size == 0 or n_samples == 0:  #- I(x1; y) ≈ (H(y) − H(y|x1))/H(y)= 1 - MSE(x1,y) / Var(y)
+            entropy_y = max(1e-3, np.var(dataset[:, y_index])) #we set 0.001 as a lower bound
+            entropy_y_given_x1 = self._mse(dataset, x1_index, y_index, cv=cv) 
             mutual_information = 1 - entropy_y_given_x1 / entropy_y 
             return max(0, mutual_information) #if negative, it means that knowing x1 brings more uncertainty to y (conditional entropy is higher than unconditional entropy)
         else: #- I(x1; y|x2) ≈ [(H(y|x2) − H(y|x1, x2))] / H(y|x2) = 1 - MSE([x1,x2],y) / MSE(x2, y)
-            if y.size == 0 or x1.size == 0:
+            if x1_index.size == 0:
                 return 0
-            x1_2d = x1 if x1.ndim > 1 else x1[:, np.newaxis]
-            x2_2d = x2 if x2.ndim > 1 else x2[:, np.newaxis]
 
-            x1x2 = np.hstack((x1_2d, x2_2d)) 
-            entropy_y_given_x2 = mse(x2, y, cv=cv) 
-            entropy_y_given_x1_x2 = mse(x1x2, y, cv=cv) # how much information x1 and x2 together have about y
+            x1x2_index = np.concatenate((x1_index, x2_index)).astype(int)
+            entropy_y_given_x2 = self._mse(dataset, x2_index.astype(int), y_index, cv=cv) 
+            entropy_y_given_x1_x2 = self._mse(dataset, x1x2_index, y_index, cv=cv) # how much information x1 and x2 together have about y
             mutual_information = 1 - entropy_y_given_x1_x2 / entropy_y_given_x2
             return max(0, mutual_information)
         
 
-    def estimate_knn_cmi(self, dataset, y_index, x1_index, x2_index = None):
+    def estimate_original_batch(self, dataset, triples, cv=2):
         """
+        Estimates many (normalized) conditional mutual informations on the same dataset at once, as estimate_original does one by one.
+
+        The MSEs the triples need are deduplicated, so a conditioning set shared by several triples is regressed once,
+        and they are evaluated together by RidgeMSE.batch.
+
+        Parameters:
+        - dataset (numpy.ndarray): The dataset.
+        - triples (list): (y_index, x1_index, x2_index) triples, x2_index being optional, None or empty for a mutual information.
+        - cv (int): The number of cross-validation folds to use.
 
+        Returns:
+        - numpy.ndarray: The estimated conditional mutual information of each triple.
         """
-        import knncmi
-        import pandas as pd
-        dataset = pd.DataFrame(dataset)
-        #make columns strings
-        dataset.columns = [str(i) for i in dataset.columns]
+        if self.mse_engine == 'sklearn' or self.proxy != 'Ridge' or dataset.shape[0] == 0:
+            return np.array([self.estimate_original(dataset, *triple, cv=cv) for triple in triples], dtype=float)
+
+        # the triples already estimated on this series are taken from the memo
+        memo = self._memo(dataset)
+        keys = [self._cmi_key('original', triple[0], triple[1], triple[2] if len(triple) > 2 else None, cv) for triple in triples]
+        results = np.array([self._memo_get(memo, key) for key in keys], dtype=float)
+        todo = np.flatnonzero(np.isnan(results))
+        if todo.size:
+            results[todo] = self._estimate_original_batch(dataset, [triples[i] for i in todo], cv)
+            for i in todo:
+                memo[keys[i]] = results[i]
+        return results
+
+    def _estimate_original_batch(self, dataset, triples, cv):
+        subproblems = []
+        positions = {}
+        def subproblem(x_index, y_index):
+            key = (int(y_index), tuple(sorted(int(i) for i in x_index)))
+            if key not in positions:
+                positions[key] = len(subproblems)
+                subproblems.append((key[1], key[0]))
+            return positions[key]
+
+        plans = []
+        for triple in triples:
+            y_index, x1_index = triple[0], np.atleast_1d(triple[1])
+            x2_index = None if len(triple) < 3 or triple[2] is None else np.atleast_1d(triple[2])
+            if x2_index is None or x2_index.size == 0: # 1 - MSE(x1,y) / Var(y)
+                plans.append((y_index, subproblem(x1_index, y_index), None))
+            elif x1_index.size == 0:
+                plans.append(None)
+            else: # 1 - MSE([x1,x2],y) / MSE(x2, y)
+                plans.append((y_index, subproblem(np.concatenate((x1_index, x2_index)), y_index), subproblem(x2_index, y_index)))
+
+        # only the MSEs missing from the cache are computed
+        dataset_id = self._dataset_id(dataset)
+        keys = [self.mse_cache.key(dataset_id, y_index, x_index, cv) for x_index, y_index in subproblems]
+        mses = np.array([self.mse_cache.get(key) for key in keys], dtype=float)
+        missing = np.flatnonzero(np.isnan(mses))
+        if missing.size:
+            mses[missing] = self._get_ridge_mse(dataset, cv).batch([subproblems[i] for i in missing])
+            for i in missing:
+                self.mse_cache.put(keys[i], mses[i])
+        variances = {}
+        results = np.zeros(len(triples))
+        for position, plan in enumerate(plans):
+            if plan is None:
+                continue
+            y_index, numerator, denominator = plan
+            if denominator is None:
+                if y_index not in variances:
+                    variances[y_index] = max(1e-3, np.var(dataset[:, y_index])) #we set 0.001 as a lower bound
+                entropy = variances[y_index]
+            else:
+                entropy = mses[denominator]
+            results[position] = max(0, 1 - mses[numerator] / entropy)
+        return results
 
-        # if x2_index is list and is empty, set it to None
-        if x2_index is not None and isinstance(x2_index, list) and len(x2_index) == 0:
-            x2_index = None
+    def estimate_knn_cmi(self, dataset, y_index, x1_index, x2_index = None):
+        """
+        Estimates the conditional mutual information of x1 to y given x2 with the k-nearest-neighbors estimator
+        of Frenzel and Pompe (KSG without x2), negative estimates being set to 0.
 
-        # print(dataset)
-        # print(dataset.columns)
-        # print(y_index)
-        # print(dataset.columns[y_index])
-        y_name = [dataset.columns[y_index]]
-        x1_name = [dataset.columns[x1_index]]
-        x2_name = None if x2_index is None else list(dataset.columns[x2_index])
-      
-        # print(y_name)
-        # print(x1_name)
-        # print(x2_name)
-        if x2_name is None:  
-            return knncmi.cmi(y_name, x1_name, [], self.k, dataset)
+        The neighbors are searched in KD-trees of the column subsets, cached for the current dataset,
+        and every point of a subset is queried at once.
 
-        else: 
-            return knncmi.cmi(y_name, x1_name, x2_name, self.k, dataset)
+        Parameters:
+        - dataset (numpy.ndarray): The dataset.
+        - y_index (int): The column of y.
+        - x1_index (int or list): The column(s) of x1.
+        - x2_index (list): The columns of x2, optional.
 
-        
+        Returns:
+        - float: The estimated conditional mutual information, in nats.
+        """
+        memo = self._memo(dataset)
+        key = self._cmi_key('knn', y_index, x1_index, x2_index, self.k)
+        mutual_information = self._memo_get(memo, key)
+        if mutual_information is None:
+            mutual_information = memo[key] = self._estimate_knn_cmi(dataset, y_index, x1_index, x2_index)
+        return mutual_information
+
+    def _estimate_knn_cmi(self, dataset, y_index, x1_index, x2_index):
+        """
+        Frenzel-Pompe estimator: I(x1; y | x2) = psi(k) - < psi(n_x1x2 + 1) + psi(n_yx2 + 1) - psi(n_x2 + 1) >,
+        where the counts are the numbers of other points strictly closer, in the max-norm on the subspace, than the k-th
+        neighbor of the point in the joint space. Without x2, n_x2 + 1 is the number of samples, as in the KSG estimator.
+        """
+        _, y, x, z, _ = self._cmi_key('knn', y_index, x1_index, x2_index, self.k)  # canonical column tuples
+        n_samples = dataset.shape[0]
+        if not x or n_samples <= self.k:
+            return 0
+
+        joint = self._knn_tree(dataset, x + (y,) + z)
+        eps = joint.query(joint.data, k=self.k + 1, p=np.inf)[0][:, -1]
+        radius = np.nextafter(eps, 0)  # strictly closer than the k-th neighbor
+
+        def count(columns):
+            tree = self._knn_tree(dataset, columns)
+            return tree.query_ball_point(tree.data, radius, p=np.inf, return_length=True) - 1
+
+        n_z = count(z) if z else np.full(n_samples, n_samples - 1)
+        mutual_information = digamma(self.k) - np.mean(
+            digamma(count(x + z) + 1) + digamma(count((y,) + z) + 1) - digamma(n_z + 1)
+        )
+        return max(0, mutual_information)
+
+    def _knn_tree(self, dataset, columns):
+        """
+        KD-tree of a subset of the columns of the dataset, built once per dataset and subset.
+        Repeated columns do not change the max-norm distances, so they are dropped.
+        """
+        if dataset is not self._tree_dataset:
+            self._trees = {}
+            self._tree_dataset = dataset
+        columns = tuple(sorted(set(columns)))
+        if columns not in self._trees:
+            self._trees[columns] = cKDTree(np.asarray(dataset, dtype=float)[:, columns])
+        return self._trees[columns]
 
 
 class LOWESS(BaseEstimator, RegressorMixin):
-    def __init__(self, tau):
+    """
+    Locally weighted linear regression: each prediction comes from a linear fit of the training points,
+    weighted by a Gaussian kernel of width tau around the predicted point.
+
+    The kernel weights of a batch of points are computed as one (n_points, n_train) matrix, the weighted normal
+    equations of all the points are formed with matrix products, without diagonal weight matrices,
+    and they are solved together as a stack. With n_neighbors, each point only weighs its nearest training points.
+    """
+
+    def __init__(self, tau, n_neighbors=None, batch_size=1024):
+        """
+        Parameters:
+        - tau (float): The width of the Gaussian kernel.
+        - n_neighbors (int): The number of nearest training points each prediction is fitted on, or None for all of them.
+        - batch_size (int): The number of points predicted together, which bounds the size of the kernel matrix.
+        """
         self.tau = tau
+        self.n_neighbors = n_neighbors
+        self.batch_size = batch_size
         self.X_ = None
         self.y_ = None
         self.theta_ = None
 
-    def wm(self, point, X):
-        # Calculate the squared differences in a vectorized way
-        # point is reshaped to (1, -1) for broadcasting to match the shape of X
-        differences = X - point.reshape(1, -1)
-        squared_distances = np.sum(differences ** 2, axis=1)
-
-        # Calculate the weights
-        tau_squared = -2 * self.tau * self.tau
-        weights = np.exp(squared_distances / tau_squared)
-
-        # Create a diagonal matrix from the weights
-        weight_matrix = np.diag(weights)
-
-        return weight_matrix
+    def kernel(self, X, X_train):
+        """
+        Gaussian weights of the training points for each point of X, as a (len(X), len(X_train)) matrix.
+        """
+        squared_distances = np.maximum(
+            0, np.sum(X ** 2, axis=1)[:, None] + np.sum(X_train ** 2, axis=1)[None, :] - 2 * X @ X_train.T
+        )
+        return np.exp(squared_distances / (-2 * self.tau * self.tau))
 
     def fit(self, X, y):
         # Fit the model to the data
         self.X_ = np.append(X, np.ones(X.shape[0]).reshape(X.shape[0],1), axis=1)
         self.y_ = np.array(y).reshape(-1, 1)
+        # the outer products of the training points, shared by the normal equations of all the predictions
+        self._outer = np.einsum('ni,nj->nij', self.X_, self.X_)
+        self._tree = cKDTree(self.X_[:, :-1]) if self.n_neighbors is not None else None
         return self
 
     def predict(self, X):
-        # Predict using the fitted model
-
-        #allocate array of size X.shape[0]
-        preds = np.empty(X.shape[0])
+        """
+        Predicts each point from its own weighted least squares fit, theta = pinv(X^T W X) X^T W y.
+        The coefficients of every point are kept in theta_.
+        """
         X_ = np.append(X, np.ones(X.shape[0]).reshape(X.shape[0],1), axis=1)
-
-        start = time.time()
-
-        for i in range(X.shape[0]):
-            point_ = X_[i] 
-            w = self.wm(point_, self.X_)
-            self.theta_ =  np.linalg.pinv(self.X_.T@(w @ self.X_))@self.X_.T@(w @ self.y_)
-            pred = np.dot(point_, self.theta_)
-            preds[i] = pred
-
+        thetas = np.empty(X_.shape)
+        for start in range(0, X_.shape[0], self.batch_size):
+            batch = X_[start:start + self.batch_size]
+            if self._tree is None:
+                weights = self.kernel(batch[:, :-1], self.X_[:, :-1])
+                gram = np.einsum('mn,nij->mij', weights, self._outer)
+                moments = weights @ (self.X_ * self.y_)
+            else:
+                k = min(self.n_neighbors, self.X_.shape[0])
+                neighbors = self._tree.query(batch[:, :-1], k=k)[1].reshape(len(batch), k)
+                weights = np.exp(np.sum((batch[:, None, :-1] - self.X_[neighbors, :-1]) ** 2, axis=2) / (-2 * self.tau * self.tau))
+                gram = np.einsum('mk,mkij->mij', weights, self._outer[neighbors])
+                moments = np.einsum('mk,mki->mi', weights, (self.X_ * self.y_)[neighbors])
+            thetas[start:start + self.batch_size] = (np.linalg.pinv(gram) @ moments[:, :, None])[:, :, 0]
+        self.theta_ = thetas
+        preds = np.einsum('mi,mi->m', X_, thetas)
         return preds.reshape(-1, 1)
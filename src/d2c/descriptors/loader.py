@@ -1,8 +1,12 @@
 import pickle
+from collections import OrderedDict
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import networkx as nx
 import pandas as pd
 
+from d2c.descriptors.dataset import MemmapDags, open_dataset, write_dataset
+
 
 class DataLoader:
     """
@@ -13,7 +17,7 @@ class DataLoader:
     3. renaming the nodes of the DAGs.
 
     Methods:
-        __init__(self, maxlags=3, n_variables=3):
+        __init__(self, maxlags=3, n_variables=3, cache_size=0):
             Initializes the DataLoader object with specified maximum lags and number of variables.
         _flatten(self, dict_of_dicts):
             Converts a dictionary of dictionaries to a single list.
@@ -23,10 +27,16 @@ class DataLoader:
             Creates lagged multiple time series from the given observations.
         _create_lagged_single_ts(obs, maxlags):
             Creates lagged single time series from the given observations.
+        _lagged_view(obs, maxlags):
+            Returns the lagged time series as a zero-copy (rows, lags, variables) view.
         from_pickle(self, data_path):
             Loads data from a pickle file.
         from_tsbuilder(self, ts_builder):
             Loads data from a TimeSeriesBuilder object.
+        from_dataset(self, path):
+            Opens a memory-mapped dataset.
+        to_dataset(self, path):
+            Writes the loaded data as a memory-mapped dataset.
         get_observations(self):
             Returns the observations after creating the lagged time series.
         get_original_observations(self):
@@ -35,18 +45,30 @@ class DataLoader:
             Returns the DAGs after renaming the nodes.
         get_true_causal_dfs(self):
             Returns dataframes indicating true causal relationships in the DAGs.
+        get_true_causal_df_long(self):
+            Returns the true causal relationships of all the DAGs in one long-format dataframe.
+        get_adjacency_tensor(self):
+            Returns the adjacency of every DAG towards the present variables, as one integer array.
+        get_series(self, index):
+            Returns the lagged observations, renamed DAG and true causal dataframe of one series.
+        iter_series(self):
+            Yields the lagged observations, renamed DAG and true causal dataframe of each series, one at a time.
     """
 
-    def __init__(self, maxlags=3, n_variables=3):
+    def __init__(self, maxlags=3, n_variables=3, cache_size=0):
         """
         Initializes the DataLoader object.
 
         Parameters:
         - maxlags (int): The maximum number of lags to create for the lagged time series.
         - n_variables (int): The number of variables in the data.
+        - cache_size (int): The number of series whose `get_series` results are kept, least recently used first out.
+        0 disables the cache, None keeps every series.
         """
         self.observations = None
         self.dags = None
+        self.cache_size = cache_size
+        self._series_cache = OrderedDict()
         self.n_variables = n_variables
         self.maxlags = maxlags
 
@@ -89,15 +111,18 @@ class DataLoader:
         Returns:
         - updated_dags (list): The list of renamed DAGs.
         """
-        updated_dags = []
-        for dag in dags:
-            mapping = {
-                node: int(node.split("_")[0]) + int(node.split("-")[1]) * n_variables
-                for node in dag.nodes()
-            }  # from x_(t-y) to x + y*n_variables
-            dag = nx.relabel_nodes(dag, mapping)
-            updated_dags.append(dag)
-        return updated_dags
+        return [DataLoader._rename_dag(dag, n_variables) for dag in dags]
+
+    @staticmethod
+    def _rename_dag(dag, n_variables):
+        """
+        Rename the nodes of a single DAG, as in `_rename_dags`.
+        """
+        mapping = {
+            node: int(node.split("_")[0]) + int(node.split("-")[1]) * n_variables
+            for node in dag.nodes()
+        }  # from x_(t-y) to x + y*n_variables
+        return nx.relabel_nodes(dag, mapping)
 
     @staticmethod
     def _create_lagged_multiple_ts(observations, maxlags):
@@ -111,29 +136,38 @@ class DataLoader:
         Returns:
         - lagged_observations (list): A list of numpy arrays representing the lagged time series observations.
         """
-        lagged_observations = []
-        for obs in observations:
-            lagged = obs.copy()
-            for i in range(1, maxlags + 1):
-                lagged = np.concatenate(
-                    (lagged, np.roll(obs, i, axis=0)), axis=1
-                )  # np roll brings last values to the top
-            lagged_observations.append(
-                lagged[maxlags:]
-            )  # we need to drop the first maxlags rows
-        return lagged_observations
+        return [
+            DataLoader._create_lagged_single_ts(obs, maxlags) for obs in observations
+        ]
 
     @staticmethod
     def _create_lagged_single_ts(obs, maxlags):
         """
         Create lagged single time series from the given observations.
+        The columns are [X_t, X_t-1, ..., X_t-maxlags] and the first maxlags rows, which lack a past, are dropped.
+        The lagged view is copied once, in a single allocation.
         """
-        lagged = obs.copy()
-        for i in range(1, maxlags + 1):
-            lagged = np.concatenate(
-                (lagged, np.roll(obs, i, axis=0)), axis=1
-            )  # np roll brings last values to the top
-        return lagged[maxlags:]
+        if obs.shape[0] <= maxlags:
+            return np.empty((0, (maxlags + 1) * obs.shape[1]), dtype=obs.dtype)
+        lagged = DataLoader._lagged_view(obs, maxlags)
+        return lagged.reshape(lagged.shape[0], -1)
+
+    @staticmethod
+    def _lagged_view(obs, maxlags):
+        """
+        Zero-copy lag embedding of a time series.
+
+        Parameters:
+        - obs (numpy.ndarray): The time series, of shape (T, n_variables), with T > maxlags.
+        - maxlags (int): The maximum number of lags.
+
+        Returns:
+        - lagged (numpy.ndarray): A read-only view of shape (T - maxlags, maxlags + 1, n_variables),
+        where lagged[r, i] is X_t-i for t = r + maxlags. Reshaping it to (T - maxlags, -1) gives the lagged time series.
+        """
+        # windows[r, :, i] is the observation at time r + i
+        windows = sliding_window_view(obs, maxlags + 1, axis=0)
+        return windows[:, :, ::-1].transpose(0, 2, 1)
 
     def from_pickle(self, data_path):
         """
@@ -148,6 +182,7 @@ class DataLoader:
             )  # third element is neighbors, not used from this point on
         self.observations = self._flatten(loaded_observations)
         self.dags = self._flatten(loaded_dags)
+        self._series_cache.clear()
 
     def from_tsbuilder(self, ts_builder):
         """
@@ -161,6 +196,28 @@ class DataLoader:
         loaded_dags = ts_builder.get_generated_dags()
         self.observations = self._flatten(loaded_observations)
         self.dags = self._flatten(loaded_dags)
+        self._series_cache.clear()
+
+    def from_dataset(self, path):
+        """
+        Data loader from a memory-mapped dataset (see d2c.descriptors.dataset).
+        Nothing is read when opening: each series is read, and each DAG built, when it is accessed.
+
+        Parameters:
+        - path (str): The directory of the dataset.
+        """
+        self.observations, self.dags, metadata = open_dataset(path)
+        self._series_cache.clear()
+        self.n_variables = metadata["n_variables"]
+
+    def to_dataset(self, path):
+        """
+        Writes the loaded observations and DAGs as a memory-mapped dataset, to be opened with `from_dataset`.
+
+        Parameters:
+        - path (str): The directory of the dataset.
+        """
+        write_dataset(path, self.observations, self.dags, self.n_variables)
 
     def get_observations(self):
         """
@@ -199,34 +256,211 @@ class DataLoader:
         - The "from" column indicates the source variable.
         - The "to" column indicates the effect variable.
         - The "is_causal" column indicates whether the source variable causes the effect variable.
+        The edges from variables beyond maxlags, when the DAGs have longer lags than the loader, follow as extra causal rows.
         """
-        causal_dataframes = {}
-        for dag_idx, dag in enumerate(self._rename_dags(self.dags, self.n_variables)):
-            pairs = [
-                (source, effect)
-                for source in range(
-                    self.n_variables, self.n_variables * self.maxlags + self.n_variables
-                )
-                for effect in range(self.n_variables)
-            ]
-            multi_index = pd.MultiIndex.from_tuples(pairs, names=["from", "to"])
-            causal_dataframe = pd.DataFrame(
-                index=multi_index,
-                columns=["effect", "p_value", "probability", "is_causal"],
-            )
-            causal_dataframe["effect"] = None
-            causal_dataframe["p_value"] = None
-            causal_dataframe["probability"] = None
-            causal_dataframe["is_causal"] = 0
-            for edge in dag.edges:
-                source = edge[0]
-                effect = edge[1]
-                causal_dataframe.loc[(source, effect), "is_causal"] = 1
-
-            causal_dataframe.reset_index(inplace=True)
-            causal_dataframe = causal_dataframe.loc[
-                causal_dataframe.to < self.n_variables
+        graph_ids, sources, effects = self._edge_table()
+        adjacency = self._adjacency(graph_ids, sources, effects, len(self.dags))
+        beyond = self._beyond_maxlags(graph_ids, sources, effects, len(self.dags))
+        return {
+            dag_idx: self._causal_frame(adjacency[dag_idx], *beyond[dag_idx])
+            for dag_idx in range(adjacency.shape[0])
+        }
+
+    def get_true_causal_df_long(self):
+        """
+        Get the true causal relationships of all the DAGs in a single long-format dataframe.
+        It holds the rows of the `get_true_causal_dfs` dataframes one after the other, with a "graph_id" column for the DAG index.
+        """
+        graph_ids, sources, effects = self._edge_table()
+        n_dags = len(self.dags)
+        adjacency = self._adjacency(graph_ids, sources, effects, n_dags)
+        beyond = self._beyond_maxlags(graph_ids, sources, effects, n_dags)
+        pair_sources, pair_effects = self._causal_pairs()
+        n_beyond = [len(beyond_sources) for beyond_sources, _ in beyond]
+
+        # the rows beyond maxlags come after the ones of their DAG, so the stable sort only moves them in place
+        long_graph_ids = np.concatenate(
+            [
+                np.repeat(np.arange(n_dags), len(pair_sources)),
+                np.repeat(np.arange(n_dags), n_beyond),
             ]
-            causal_dataframes[dag_idx] = causal_dataframe
+        )
+        order = np.argsort(long_graph_ids, kind="stable")
+        return pd.DataFrame(
+            {
+                "graph_id": long_graph_ids[order],
+                "from": np.concatenate(
+                    [np.tile(pair_sources, n_dags)]
+                    + [beyond_sources for beyond_sources, _ in beyond]
+                )[order],
+                "to": np.concatenate(
+                    [np.tile(pair_effects, n_dags)]
+                    + [beyond_effects for _, beyond_effects in beyond]
+                )[order],
+                "effect": None,
+                "p_value": None,
+                "probability": None,
+                "is_causal": np.concatenate(
+                    [
+                        adjacency[:, self.n_variables :, :].reshape(-1),
+                        np.ones(sum(n_beyond), dtype=np.int8),
+                    ]
+                ).astype(np.int64)[order],
+            }
+        )
 
-        return causal_dataframes
+    def get_adjacency_tensor(self):
+        """
+        Get the adjacency of every DAG towards the present variables, up to maxlags.
+
+        Returns:
+        - adjacency (numpy.ndarray): An int8 array of shape (n_dags, n_variables * (maxlags + 1), n_variables),
+        where adjacency[d, source, effect] is 1 if the renamed DAG d has the edge source -> effect.
+        """
+        return self._adjacency(*self._edge_table(), len(self.dags))
+
+    def _adjacency(self, graph_ids, sources, effects, n_dags):
+        """
+        Build the adjacency tensor of `get_adjacency_tensor` from the edge table.
+        """
+        adjacency = np.zeros(
+            (n_dags, self.n_variables * (self.maxlags + 1), self.n_variables),
+            dtype=np.int8,
+        )
+        # edges between past variables, or beyond maxlags, do not fit in the tensor
+        kept = (effects < self.n_variables) & (sources < adjacency.shape[1])
+        adjacency[graph_ids[kept], sources[kept], effects[kept]] = 1
+        return adjacency
+
+    def _beyond_maxlags(self, graph_ids, sources, effects, n_dags):
+        """
+        Get the edges from a variable beyond maxlags to a present variable, which the adjacency tensor cannot hold.
+
+        Returns:
+        - beyond (list): For each DAG, the sources and effects of its edges beyond maxlags, in the order of the edge table.
+        """
+        beyond = (effects < self.n_variables) & (
+            sources >= self.n_variables * (self.maxlags + 1)
+        )
+        # the edge table lists the edges DAG after DAG
+        bounds = np.searchsorted(graph_ids[beyond], np.arange(n_dags + 1))
+        return [
+            (sources[beyond][start:stop], effects[beyond][start:stop])
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def _edge_table(self):
+        """
+        Get the edges of all the DAGs, with nodes renamed as in `_rename_dags`.
+
+        Returns:
+        - graph_ids, sources, effects (numpy.ndarray): The DAG index, source and effect of each edge.
+        """
+        if isinstance(
+            self.dags, MemmapDags
+        ):  # the dataset already stores renamed edges
+            edges = np.asarray(self.dags.edges)
+            counts = np.diff(self.dags.edge_offsets)
+            graph_ids = np.repeat(np.arange(len(self.dags)), counts)
+            return graph_ids, edges[:, 0], edges[:, 1]
+
+        graph_ids, sources, effects = [], [], []
+        for dag_idx, dag in enumerate(self.dags):
+            for source, effect in dag.edges:
+                graph_ids.append(dag_idx)
+                # from x_(t-y) to x + y*n_variables
+                sources.append(
+                    int(source.split("_")[0])
+                    + int(source.split("-")[1]) * self.n_variables
+                )
+                effects.append(
+                    int(effect.split("_")[0])
+                    + int(effect.split("-")[1]) * self.n_variables
+                )
+        return (
+            np.array(graph_ids, dtype=np.int64),
+            np.array(sources, dtype=np.int64),
+            np.array(effects, dtype=np.int64),
+        )
+
+    def _causal_pairs(self):
+        """
+        Get the (source, effect) couples of a true causal dataframe: every past variable towards every present variable.
+        """
+        sources = np.arange(self.n_variables, self.n_variables * (self.maxlags + 1))
+        effects = np.arange(self.n_variables)
+        return np.repeat(sources, len(effects)), np.tile(effects, len(sources))
+
+    def _causal_frame(self, adjacency, beyond_sources=(), beyond_effects=()):
+        """
+        Build the true causal dataframe of a single DAG from its adjacency and its edges beyond maxlags,
+        as described in `get_true_causal_dfs`.
+        """
+        sources, effects = self._causal_pairs()
+        return pd.DataFrame(
+            {
+                "from": np.concatenate([sources, beyond_sources]).astype(np.int64),
+                "to": np.concatenate([effects, beyond_effects]).astype(np.int64),
+                "effect": None,
+                "p_value": None,
+                "probability": None,
+                "is_causal": np.concatenate(
+                    [
+                        adjacency[self.n_variables :, :].reshape(-1),
+                        np.ones(len(beyond_sources), dtype=np.int8),
+                    ]
+                ).astype(np.int64),
+            }
+        )
+
+    def _true_causal_df(self, dag):
+        """
+        Build the true causal dataframe of a single renamed DAG, as described in `get_true_causal_dfs`.
+        """
+        edges = np.array(list(dag.edges), dtype=np.int64).reshape(-1, 2)
+        graph_ids = np.zeros(len(edges), dtype=np.int64)
+        adjacency = self._adjacency(graph_ids, edges[:, 0], edges[:, 1], 1)
+        beyond = self._beyond_maxlags(graph_ids, edges[:, 0], edges[:, 1], 1)
+        return self._causal_frame(adjacency[0], *beyond[0])
+
+    def get_series(self, index):
+        """
+        Get one series, prepared on demand: nothing is computed for the other series.
+
+        Parameters:
+        - index (int): The position of the series, as in the lists returned by the other getters.
+
+        Returns:
+        - lagged_observations (numpy.ndarray): The lagged time series, as in `get_observations`.
+        - dag (networkx.DiGraph): The renamed DAG, as in `get_dags`.
+        - true_causal_df (pandas.DataFrame): The true causal dataframe, as in `get_true_causal_dfs`.
+        """
+        if index in self._series_cache:
+            self._series_cache.move_to_end(index)
+            return self._series_cache[index]
+
+        dag = self._rename_dag(self.dags[index], self.n_variables)
+        series = (
+            self._create_lagged_single_ts(self.observations[index], self.maxlags),
+            dag,
+            self._true_causal_df(dag),
+        )
+
+        if self.cache_size != 0:
+            self._series_cache[index] = series
+            if (
+                self.cache_size is not None
+                and len(self._series_cache) > self.cache_size
+            ):
+                self._series_cache.popitem(last=False)
+        return series
+
+    def iter_series(self):
+        """
+        Iterate over the series, preparing each of them only when it is reached.
+
+        Yields:
+        - tuple: (lagged_observations, dag, true_causal_df) for each series, as returned by `get_series`.
+        """
+        for index in range(len(self.observations)):
+            yield self.get_series(index)
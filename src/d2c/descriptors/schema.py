@@ -0,0 +1,182 @@
+"""
+This module contains the DescriptorSchema, the fixed layout of the descriptors computed by D2C.
+"""
+
+import numpy as np
+import pandas as pd
+
+# the quantiles summarizing a family of descriptors
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+class DescriptorSchema:
+    """
+    The columns of the descriptors of a couple, decided once from the options of D2C,
+    so that the descriptors of every couple are written in a row of a preallocated matrix.
+
+    A family of descriptors takes one column per quantile or, without quantiles, one column per value
+    up to the largest size the family can have. The columns of the values a couple does not have are left to NaN.
+
+    Attributes:
+        columns (list): The names of the columns, in order.
+        index (dict): The position of each single-valued column.
+        families (dict): The slice of the columns of each family.
+        integer_columns (list): The columns holding integers.
+
+    Methods:
+        __init__(self, full, quantiles, markov_blanket_size):
+
+        allocate(self, n_rows, dtype=np.float64):
+
+        fill_family(self, row, name, values):
+
+        check_exact(self, dtype, largest):
+
+        to_frame(self, matrix):
+
+        to_dict(self, row):
+    """
+
+    def __init__(self, full, quantiles, markov_blanket_size):
+        """
+        Parameters:
+        - full (bool): Whether all the descriptors are computed.
+        - quantiles (bool): Whether the families are summarized by their quantiles.
+        - markov_blanket_size (int): The largest size of an estimated Markov blanket.
+        """
+        self.quantiles = quantiles
+        self.columns = []
+        self.index = {}
+        self.families = {}
+
+        size = markov_blanket_size
+        for name in [
+            "graph_id",
+            "edge_source",
+            "edge_dest",
+            "is_causal",
+            "coeff_cause",
+            "coeff_eff",
+            "HOC_3_1",
+            "HOC_1_2",
+            "HOC_2_1",
+            "HOC_1_3",
+            "kurtosis_ca",
+            "kurtosis_ef",
+        ]:
+            self._add_column(name)
+        self._add_family("mca_mef_cau", size * size)
+        self._add_family("mca_mef_eff", size * size)
+        self._add_family("cau_m_eff", size)
+        self._add_family("eff_m_cau", size)
+
+        if full:
+            self._add_family("m_cau", size)
+            for name in [
+                "com_cau",
+                "cau_eff",
+                "eff_cau",
+                "eff_cau_mbeff",
+                "cau_eff_mbcau",
+            ]:
+                self._add_column(name)
+            self._add_family("eff_cau_mbcau_plus", size)
+            self._add_family("cau_eff_mbeff_plus", size)
+            self._add_family("m_eff", size)
+            self._add_family("mca_mca_cau", size * (size - 1))
+            self._add_family("mbe_mbe_eff", size * (size - 1))
+            for name in [
+                "n_samples",
+                "n_features",
+                "n_features/n_samples",
+                "skewness_ca",
+                "skewness_ef",
+            ]:
+                self._add_column(name)
+
+        self.integer_columns = [
+            name
+            for name in [
+                "graph_id",
+                "edge_source",
+                "edge_dest",
+                "is_causal",
+                "n_samples",
+                "n_features",
+            ]
+            if name in self.index
+        ]
+
+    def _add_column(self, name):
+        self.index[name] = len(self.columns)
+        self.columns.append(name)
+
+    def _add_family(self, name, max_size):
+        start = len(self.columns)
+        if self.quantiles:
+            self.columns.extend(f"{name}_q{i}" for i in range(len(QUANTILES)))
+        else:
+            # an empty family counts as a single 0, so it has at least one column
+            self.columns.extend(f"{name}_{i}" for i in range(max(1, max_size)))
+        self.families[name] = slice(start, len(self.columns))
+
+    def allocate(self, n_rows, dtype=np.float64):
+        """
+        Returns a matrix for the descriptors of n_rows couples, filled with NaN.
+        """
+        return np.full((n_rows, len(self.columns)), np.nan, dtype=dtype)
+
+    def fill_family(self, row, name, values):
+        """
+        Writes a family of descriptors in a row: their quantiles, or their actual values.
+        An empty family counts as a single 0.
+        """
+        values = [0] if not len(values) else values
+        if self.quantiles:
+            values = np.quantile(values, QUANTILES)
+        columns = self.families[name]
+        row[columns.start : columns.start + len(values)] = values
+
+    def check_exact(self, dtype, largest):
+        """
+        Checks that a matrix of the given type holds the integer columns exactly.
+
+        Args:
+            dtype (numpy.dtype): The type of the matrix.
+            largest (int): The largest integer written in the matrix.
+
+        Raises:
+            ValueError: If the type cannot represent all the integers up to `largest`, as float32 beyond 2**24.
+        """
+        limit = 2 ** (np.finfo(dtype).nmant + 1)
+        if largest > limit:
+            raise ValueError(
+                f"A {np.dtype(dtype).name} matrix cannot hold the integers {', '.join(self.integer_columns)} "
+                f"exactly beyond {limit}, and they reach {largest}. Use np.float64."
+            )
+
+    def to_frame(self, matrix):
+        """
+        Wraps a matrix of descriptors in a DataFrame without copying it.
+        Only the integer columns are converted, unless they hold NaN (the labels of unlabeled couples).
+        The columns are the ones of the schema, whatever the values: the family values a couple does not have are NaN.
+        """
+        frame = pd.DataFrame(matrix, columns=self.columns, copy=False)
+        integer_columns = {
+            name: np.int64
+            for name in self.integer_columns
+            if not np.isnan(matrix[:, self.index[name]]).any()
+        }
+        if integer_columns:
+            frame = frame.astype(integer_columns)
+        return frame
+
+    def to_dict(self, row):
+        """
+        Returns the descriptors of a row as a dictionary with a key per column, NaN for the family values the couple does not have.
+        """
+        integer_columns = set(self.integer_columns)
+        return {
+            name: int(value) if name in integer_columns and value == value else value
+            for name, value in zip(self.columns, row.tolist())
+        }
@@ -0,0 +1,122 @@
+"""
+This module is responsible for streaming the descriptors computed by D2C to disk.
+
+A store is a directory holding numbered `.npy` shards and a small `manifest.json`.
+Each shard is a matrix of descriptors, a row per couple, laid out by the DescriptorSchema of the run.
+The manifest records the parameters of the run and, for each shard, the DAGs whose couples it contains
+and their test couples, so that an interrupted run can resume with the first DAG not written yet.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+class DescriptorWriter:
+    """
+    DescriptorWriter appends the descriptors of finished DAGs to an on-disk store, a shard at a time.
+
+    Attributes:
+        path (str): Directory of the store.
+        manifest (dict): Content of the manifest file.
+
+    Methods:
+        __init__(self, path, metadata):
+
+        write(self, dags, descriptors, test_couples=()):
+
+        get_done(self):
+
+        get_test_couples(self):
+    """
+
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, path, metadata):
+        """
+        Opens a store, creating it if needed.
+
+        Args:
+            path (str): Directory of the store.
+            metadata (dict): Parameters of the run. They must match the ones of an existing store.
+
+        Raises:
+            ValueError: If the store exists and was written with different parameters.
+        """
+        self.path = path
+
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, self.MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            if self.manifest["metadata"] != metadata:
+                raise ValueError(
+                    f"The store in {path} was written with different parameters: {self.manifest['metadata']}"
+                )
+        else:
+            self.manifest = {"metadata": metadata, "shards": []}
+
+    def write(self, dags, descriptors, test_couples=()):
+        """
+        Writes the descriptors of the couples of some DAGs to a new shard, then records it in the manifest.
+        The manifest is replaced atomically, so a crash never leaves a shard half-registered.
+
+        Args:
+            dags (list): The indices of the DAGs, all of whose couples are in the shard.
+            descriptors (numpy.ndarray): The matrix of the descriptors.
+            test_couples (list): The test couples of the DAGs.
+        """
+        file_name = f"shard_{len(self.manifest['shards']):05d}.npy"
+        np.save(os.path.join(self.path, file_name), descriptors)
+
+        self.manifest["shards"].append(
+            {
+                "file": file_name,
+                "dags": [int(dag_idx) for dag_idx in dags],
+                "n_rows": int(descriptors.shape[0]),
+                "test_couples": [[int(a), int(b)] for a, b in test_couples],
+            }
+        )
+        manifest_path = os.path.join(self.path, self.MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def get_done(self):
+        """
+        Returns the set of the indices of the DAGs already written.
+        """
+        return {dag_idx for shard in self.manifest["shards"] for dag_idx in shard["dags"]}
+
+    def get_test_couples(self):
+        """
+        Returns the test couples of the DAGs already written, in order.
+        """
+        return [
+            tuple(couple)
+            for shard in self.manifest["shards"]
+            for couple in shard.get("test_couples", [])
+        ]
+
+
+def read_descriptor_shards(path, mmap_mode=None):
+    """
+    Reads a store back, one shard at a time.
+
+    Args:
+        path (str): Directory of the store.
+        mmap_mode (str): Passed to np.load, "r" maps the shards instead of reading them.
+
+    Yields:
+        tuple: (dags, descriptors) for every shard, in the order they were written.
+    """
+    with open(
+        os.path.join(path, DescriptorWriter.MANIFEST_FILE), "r", encoding="utf-8"
+    ) as f:
+        manifest = json.load(f)
+    for shard_info in manifest["shards"]:
+        yield shard_info["dags"], np.load(
+            os.path.join(path, shard_info["file"]), mmap_mode=mmap_mode
+        )
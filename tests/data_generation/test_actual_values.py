@@ -992,3 +992,41 @@ def test_observations_from_model_20(initialization):
                         )
 
                         assert value == 0.5 * Y_bar_t_minus_3
+
+
+@pytest.mark.parametrize("model_id", range(1, 21))
+def test_compiled_kernel_matches_update(model_id):
+    pytest.importorskip("numba")
+    from d2c.data_generation import kernels  # registers the compiled recurrences
+    from d2c.data_generation.models import neighbor_matrix
+
+    rng = np.random.default_rng(model_id)
+    n_variables = 4
+    N_j = [[0, 2], [1], [2, 3, 0], [3, 1]]
+    W = rng.normal(0, 0.1, (50, n_variables))
+    Y = np.full((50, n_variables), np.nan)
+    Y[:4] = rng.uniform(-1, 1, (4, n_variables))
+    indices, _, sizes = neighbor_matrix(N_j)
+
+    kernel = model_registry.get_kernel(model_id)
+    kernel(Y, indices, sizes, W, 3, False)
+
+    # each compiled step is compared to the update function applied to the previous rows
+    model = model_registry.get_model(model_id)
+    for t in range(3, 49):
+        for j in range(n_variables):
+            expected = model.update(Y, t, j, N_j[j], W)
+            assert math.isclose(Y[t + 1, j], expected, rel_tol=1e-12, abs_tol=1e-15)
+
+
+def test_compiled_build_matches_python_build():
+    pytest.importorskip("numba")
+    for model in [2, 9, 14, 18]:
+        generated = []
+        for compiled in [False, True]:
+            ts_builder = TSBuilder(observations_per_time_series=100, n_variables=3, time_series_per_process=2, processes_to_use=[model], max_neighborhood_size=2, seed=42, lazy=True, compiled=compiled, verbose=False)
+            ts_builder.build()
+            generated.append(ts_builder.get_generated_observations()[model])
+
+        for ts_index, data in generated[0].items():
+            assert np.allclose(data, generated[1][ts_index], rtol=1e-10, atol=1e-12)
@@ -1,3 +1,4 @@
+import json
 import numpy as np
 import pytest
 from d2c.data_generation.builder import TSBuilder  
@@ -49,4 +50,115 @@ def test_valid_data_generated():
             assert not np.any(np.isnan(data))
             assert not np.any(np.isinf(data))
 
-    #TODO: Similar checks can be added for the DAGs
\ No newline at end of file
+    #TODO: Similar checks can be added for the DAGs
+
+def test_vectorized_build_is_bit_identical():
+    for process in [1, 7, 9, 16, 20]:
+        generated = []
+        for vectorized in [False, True]:
+            ts_builder = TSBuilder(observations_per_time_series=50, n_variables=4, time_series_per_process=2, processes_to_use=[process], max_neighborhood_size=3, seed=3, vectorized=vectorized, verbose=False)
+            ts_builder.build()
+            generated.append(ts_builder.get_generated_observations()[process])
+
+        for ts_index in generated[0]:
+            assert np.array_equal(generated[0][ts_index], generated[1][ts_index])
+        assert generated[0].keys() == generated[1].keys()
+
+
+def test_batched_build_matches_sequential():
+    for process in [2, 6, 13, 19]:
+        builders = []
+        for batched in [False, True]:
+            ts_builder = TSBuilder(observations_per_time_series=50, n_variables=4, time_series_per_process=3, processes_to_use=[process], max_neighborhood_size=3, seed=5, max_attempts=3, batched=batched, verbose=False)
+            ts_builder.build()
+            builders.append(ts_builder)
+
+        sequential, batched = builders
+        for ts_index, data in sequential.get_generated_observations()[process].items():
+            assert np.array_equal(data, batched.get_generated_observations()[process][ts_index])
+            assert str(sequential.get_generated_neighbors()[process][ts_index]) == str(batched.get_generated_neighbors()[process][ts_index])
+
+
+def test_valid_mask():
+    series = np.full((4, 3, 2), 0.5)
+    series[1, 0, 0] = np.nan
+    series[2, 2, 1] = 1e7
+    series[3, 1, 1] = 1e-8
+    assert TSBuilder._valid_mask(series).tolist() == [True, False, False, False]
+
+
+def test_lazy_build_is_reproducible():
+    generated = []
+    for batched in [False, True, False]:
+        ts_builder = TSBuilder(observations_per_time_series=50, n_variables=4, time_series_per_process=3, processes_to_use=[1, 17], max_neighborhood_size=3, seed=11, lazy=True, batched=batched, verbose=False)
+        ts_builder.build()
+        generated.append(ts_builder.get_generated_observations())
+
+    for observations in generated[1:]:
+        for process, ts_data in generated[0].items():
+            assert list(observations[process].keys()) == list(range(3))
+            for ts_index, data in ts_data.items():
+                assert np.array_equal(data, observations[process][ts_index])
+                assert TSBuilder._valid_mask(data)
+
+
+def test_parallel_build_does_not_depend_on_n_jobs():
+    generated = []
+    for n_jobs in [1, 2, 3]:
+        ts_builder = TSBuilder(observations_per_time_series=50, n_variables=4, time_series_per_process=3, processes_to_use=[3, 8], max_neighborhood_size=3, seed=13, lazy=True, n_jobs=n_jobs, verbose=False)
+        ts_builder.build()
+        generated.append(ts_builder)
+
+    for ts_builder in generated[1:]:
+        for process, ts_data in generated[0].get_generated_observations().items():
+            for ts_index, data in ts_data.items():
+                assert np.array_equal(data, ts_builder.get_generated_observations()[process][ts_index])
+                assert str(generated[0].get_generated_neighbors()[process][ts_index]) == str(ts_builder.get_generated_neighbors()[process][ts_index])
+
+
+def test_streamed_build_resumes_after_last_shard(tmp_path):
+    parameters = dict(observations_per_time_series=50, n_variables=4, time_series_per_process=3, processes_to_use=[1, 17], max_neighborhood_size=3, seed=7, verbose=False)
+    in_memory = TSBuilder(**parameters)
+    in_memory.build()
+
+    TSBuilder(**parameters, output_dir=tmp_path, shard_size=2).build()
+    # simulate an interrupted build by forgetting the last shards
+    index = json.loads((tmp_path / "index.json").read_text())
+    index["shards"] = index["shards"][:1]
+    (tmp_path / "index.json").write_text(json.dumps(index))
+    TSBuilder(**parameters, output_dir=tmp_path, shard_size=2).build()
+
+    streamed = TSBuilder.from_store(tmp_path)
+    for process, ts_data in in_memory.get_generated_observations().items():
+        assert list(streamed.get_generated_observations()[process].keys()) == list(ts_data.keys())
+        for ts_index, data in ts_data.items():
+            assert np.array_equal(data, streamed.get_generated_observations()[process][ts_index])
+            assert set(in_memory.generated_dags[process][ts_index].edges) == set(streamed.generated_dags[process][ts_index].edges)
+
+    with pytest.raises(ValueError):
+        TSBuilder(**{**parameters, "seed": 8}, output_dir=tmp_path).build()
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_batched_streamed_build_writes_shards_as_it_goes(tmp_path, lazy):
+    parameters = dict(observations_per_time_series=50, n_variables=4, time_series_per_process=5, processes_to_use=[1, 17], max_neighborhood_size=3, seed=7, batched=True, lazy=lazy, verbose=False)
+    in_memory = TSBuilder(**parameters)
+    in_memory.build()
+
+    TSBuilder(**parameters, output_dir=tmp_path, shard_size=2).build()
+    # the buffer never holds a whole process
+    shards = json.loads((tmp_path / "index.json").read_text())["shards"]
+    assert len(shards) > len(parameters["processes_to_use"])
+    assert all(len(shard["units"]) < 4 for shard in shards)
+
+    # the chunks draw in the same order as the whole process, and can be resumed from
+    index = json.loads((tmp_path / "index.json").read_text())
+    index["shards"] = index["shards"][:2]
+    (tmp_path / "index.json").write_text(json.dumps(index))
+    TSBuilder(**parameters, output_dir=tmp_path, shard_size=2).build()
+
+    streamed = TSBuilder.from_store(tmp_path)
+    for process, ts_data in in_memory.get_generated_observations().items():
+        assert list(streamed.get_generated_observations()[process].keys()) == list(ts_data.keys())
+        for ts_index, data in ts_data.items():
+            assert np.array_equal(data, streamed.get_generated_observations()[process][ts_index])
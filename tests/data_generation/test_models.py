@@ -2,7 +2,8 @@ import pytest
 import math
 import sys
 import networkx as nx
-from d2c.data_generation.models import model_registry
+import numpy as np
+from d2c.data_generation.models import model_registry, neighbor_matrix
 
 
 
@@ -287,7 +288,8 @@ import pytest
 import math
 import sys
 sys.path.append("../..")
-from d2c.data_generation.models import model_registry
+import numpy as np
+from d2c.data_generation.models import model_registry, neighbor_matrix
 from d2c.data_generation.models import add_edges
 
 
@@ -331,3 +333,19 @@ def test_add_edges():
     assert len(G.edges) == 15
 
 
+
+
+@pytest.mark.parametrize("model_id", range(1, 21))
+def test_step_matches_update(model_id):
+    rng = np.random.default_rng(model_id)
+    Y = rng.uniform(-1, 1, (6, 4))
+    W = rng.normal(0, 0.1, (6, 4))
+    N_j = [[0, 2], [1], [2, 3, 0], [3, 1]]
+    t = 4
+    model = model_registry.get_model(model_id)
+
+    result = model.step(Y, t, neighbor_matrix(N_j), W)
+    expected_result = [model.update(Y, t, j, N_j[j], W) for j in range(4)]
+
+    # the vectorized step must be bit-identical to the scalar update
+    assert result.tolist() == expected_result
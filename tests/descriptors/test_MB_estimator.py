@@ -39,3 +39,48 @@ def test_estimate_markov_blanket_sizes(size, expected):
     markov_blanket = estimator.estimate(dataset, node)
     assert len(markov_blanket) == expected
     assert node not in markov_blanket
+
+def test_matrix_engine_matches_pearsonr_ranking():
+    rng = np.random.default_rng(0)
+    dataset = rng.normal(size=(200, 12))
+    dataset[:, 1:] += 0.5 * dataset[:, :-1] * np.arange(1, 12) / 6
+    np.testing.assert_allclose(MarkovBlanketEstimator().correlation_matrix(dataset), np.corrcoef(dataset.T), atol=1e-12)
+    for size in [1, 4, 11]:
+        matrix = MarkovBlanketEstimator(size=size, verbose=False)
+        pearson = MarkovBlanketEstimator(size=size, verbose=False, engine='pearsonr')
+        for node in range(12):
+            assert np.array_equal(matrix.estimate(dataset, node), pearson.estimate(dataset, node))
+
+def test_mrmr_matches_naive_selection():
+    from sklearn.feature_selection import mutual_info_regression
+
+    rng = np.random.default_rng(1)
+    dataset = rng.normal(size=(150, 7))
+    dataset[:, 1] += dataset[:, 0]
+    dataset[:, 2] += dataset[:, 0] + 0.1 * dataset[:, 1]
+    estimator = MarkovBlanketEstimator(size=4, verbose=False)
+    mi = estimator.mutual_information_matrix(dataset)
+    assert np.allclose(mi, mi.T) and np.all(np.diag(mi) == 0)
+    assert np.isclose(mi[0, 3], mutual_info_regression(dataset[:, [3]], dataset[:, 0], random_state=0)[0])
+
+    for node in range(7):
+        selected = [max((c for c in range(7) if c != node), key=lambda c: mi[c, node])]
+        while len(selected) < 4:
+            remaining = [c for c in range(7) if c != node and c not in selected]
+            selected.append(max(remaining, key=lambda c: mi[c, node] - np.mean(mi[c, selected])))
+        assert list(estimator.estimate_mrmr(dataset, node)) == selected
+
+def test_regression_importances_match_ridgecv():
+    from sklearn.linear_model import RidgeCV
+
+    rng = np.random.default_rng(2)
+    dataset = rng.normal(size=(80, 9)) * rng.uniform(0.1, 10, size=9)
+    dataset[:, 1:] += 0.7 * dataset[:, :-1]
+    estimator = MarkovBlanketEstimator(size=3, verbose=False, engine='ridge')
+    importances = estimator.regression_importances(dataset)
+    for node in range(9):
+        others = [c for c in range(9) if c != node]
+        coef = RidgeCV().fit(dataset[:, others], dataset[:, node]).coef_
+        np.testing.assert_allclose(importances[node, others], np.abs(coef), rtol=1e-8, atol=1e-12)
+        expected = np.array(others)[estimator.rank_features(dataset[:, others], dataset[:, node], regr=True)][:3]
+        assert np.array_equal(estimator.estimate(dataset, node), expected)
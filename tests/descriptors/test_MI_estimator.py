@@ -4,7 +4,7 @@ import pytest
 from sklearn.linear_model import Ridge
 from sklearn.metrics import mean_squared_error
 
-from d2c.descriptors.estimators import MutualInformationEstimator, LOWESS, mse
+from d2c.descriptors.estimators import MutualInformationEstimator, LOWESS, mse, RidgeMSE, MSECache
 
 @pytest.fixture
 def default_mi_estimator():
@@ -87,3 +87,129 @@ def test_estimate_method_negative_mi(default_mi_estimator):
     assert mi >= 0
 
 
+
+def test_ridge_mse_matches_cross_validated_ridge():
+    rng = np.random.default_rng(0)
+    dataset = rng.normal(size=(101, 8)) * rng.uniform(0.5, 5, size=8) + 3
+    dataset[:, 1] += 2 * dataset[:, 0]
+    for cv in [2, 3]:
+        ridge_mse = RidgeMSE(dataset, cv=cv)
+        for x_index, y_index in [([0], 1), ([2, 3, 4], 1), ([0, 5, 6, 7], 2), (3, 0)]:
+            expected = mse(dataset[:, np.atleast_1d(x_index)], dataset[:, y_index], cv=cv)
+            assert np.isclose(ridge_mse(x_index, y_index), expected, rtol=1e-9)
+
+def test_estimate_original_engines_agree():
+    rng = np.random.default_rng(1)
+    dataset = rng.normal(size=(80, 6))
+    dataset[:, 0] += dataset[:, 1] - dataset[:, 2]
+    gram = MutualInformationEstimator(mse_engine='gram')
+    sklearn = MutualInformationEstimator(mse_engine='sklearn')
+    for args in [(0, 1), (0, 1, [2, 3]), (0, 1, []), (4, 2, np.array([0, 5]))]:
+        assert np.isclose(gram.estimate_original(dataset, *args), sklearn.estimate_original(dataset, *args), rtol=1e-9, atol=1e-12)
+
+def test_estimate_original_batch_matches_scalar_calls():
+    rng = np.random.default_rng(2)
+    dataset = rng.normal(size=(90, 7))
+    dataset[:, 0] += dataset[:, 3] + 0.5 * dataset[:, 4]
+    triples = [(0, 3), (0, 3, [4]), (0, 3, [4, 5]), (1, 2, []), (0, 4, np.array([5, 3])), (2, [], [1]), (0, 3, [4])]
+    for engine in ['gram', 'sklearn']:
+        estimator = MutualInformationEstimator(mse_engine=engine)
+        batch = estimator.estimate_original_batch(dataset, triples)
+        scalar = MutualInformationEstimator(mse_engine=engine)
+        expected = [scalar.estimate_original(dataset, *triple) for triple in triples]
+        assert batch.shape == (len(triples),)
+        assert np.allclose(batch, expected, rtol=1e-9, atol=1e-12)
+
+def test_mse_cache_lru_and_counters():
+    cache = MSECache(maxsize=2)
+    assert cache.key('d', 1, [3, 0], 2) == cache.key('d', 1, np.array([0, 3]), 2)
+    assert cache.get(('d', 1, (0,), 2)) is None
+    cache.put(('d', 1, (0,), 2), 0.5)
+    cache.put(('d', 1, (2,), 2), 0.7)
+    assert cache.get(('d', 1, (0,), 2)) == 0.5
+    cache.put(('d', 1, (3,), 2), 0.9)  # evicts the least recently used entry
+    assert cache.get(('d', 1, (2,), 2)) is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3, 'size': 2}
+
+def test_mse_cache_reuses_conditioning_sets():
+    rng = np.random.default_rng(3)
+    dataset = rng.normal(size=(60, 5))
+    shared = {}
+    estimator = MutualInformationEstimator(mse_cache=MSECache(shared=shared))
+    first = estimator.estimate_original(dataset, 0, 1, [2, 3])
+    misses = estimator.mse_cache.misses
+    assert estimator.estimate_original(dataset, 0, 4, [3, 2]) is not None  # mse(x2, y) is a hit
+    assert estimator.mse_cache.hits == 1 and estimator.mse_cache.misses == misses + 1
+    # another process sharing the mapping finds the values computed here
+    other = MutualInformationEstimator(mse_cache=MSECache(shared=shared))
+    assert other.estimate_original(dataset.copy(), 0, 1, [2, 3]) == first
+    assert other.mse_cache.misses == 0
+
+def test_cmi_memo_is_per_series():
+    rng = np.random.default_rng(4)
+    dataset = rng.normal(size=(60, 5))
+    estimator = MutualInformationEstimator()
+    value = estimator.estimate_original(dataset, 0, 1, [2, 3])
+    assert estimator.estimate_original(dataset, 0, 1, [3, 2]) == value
+    batch = estimator.estimate_original_batch(dataset, [(0, 1, [2, 3]), (0, 4)])
+    assert batch[0] == value
+    stats = estimator.reuse_stats()['cmi']
+    assert (stats['hits'], stats['misses'], stats['size']) == (2, 2, 2)
+    estimator.estimate_original(rng.normal(size=(60, 5)), 0, 1)  # another series starts a new memo
+    assert estimator.reuse_stats()['cmi']['size'] == 1
+
+def test_knn_cmi_matches_brute_force_frenzel_pompe():
+    from scipy.special import digamma
+
+    def brute_force(dataset, y, x, z, k):
+        def distances(columns):
+            points = dataset[:, columns]
+            return np.max(np.abs(points[:, None, :] - points[None, :, :]), axis=2)
+        eps = np.sort(distances(x + [y] + z), axis=1)[:, k]
+        count = lambda columns: (distances(columns) < eps[:, None]).sum(axis=1) - 1
+        n_z = count(z) if z else np.full(len(dataset), len(dataset) - 1)
+        return max(0, digamma(k) - np.mean(digamma(count(x + z) + 1) + digamma(count([y] + z) + 1) - digamma(n_z + 1)))
+
+    rng = np.random.default_rng(5)
+    dataset = rng.normal(size=(120, 5))
+    dataset[:, 1] += dataset[:, 0]
+    dataset[:, 2] += dataset[:, 1]
+    estimator = MutualInformationEstimator(k=3)
+    for y, x, z in [(2, [0], [1]), (1, [0], []), (2, [0, 3], [1, 4]), (0, [2], [1])]:
+        assert np.isclose(estimator.estimate_knn_cmi(dataset, y, x, z), brute_force(dataset, y, x, z, 3))
+    assert estimator.estimate_knn_cmi(dataset, 1, 0, None) == estimator.estimate_knn_cmi(dataset, 1, [0], [])
+
+def test_knn_mi_of_correlated_gaussians():
+    rng = np.random.default_rng(6)
+    a = rng.normal(size=3000)
+    b = 0.8 * a + 0.6 * rng.normal(size=3000)
+    estimate = MutualInformationEstimator(k=5).estimate_knn_cmi(np.c_[a, b], 0, 1)
+    assert abs(estimate - (-0.5 * np.log(1 - 0.8 ** 2))) < 0.05
+
+def test_lowess_matches_pointwise_weighted_least_squares():
+    rng = np.random.default_rng(7)
+    X = rng.normal(size=(120, 2))
+    y = np.sin(X[:, 0]) + X[:, 1] ** 2
+    X_test = rng.normal(size=(30, 2))
+
+    X_train_ = np.c_[X, np.ones(len(X))]
+    expected = []
+    for point in np.c_[X_test, np.ones(len(X_test))]:
+        weights = np.diag(np.exp(np.sum((X_train_ - point) ** 2, axis=1) / (-2 * 0.5 ** 2)))
+        theta = np.linalg.pinv(X_train_.T @ weights @ X_train_) @ X_train_.T @ weights @ y
+        expected.append(point @ theta)
+
+    for model in [LOWESS(tau=0.5, batch_size=7), LOWESS(tau=0.5, n_neighbors=len(X))]:
+        predictions = model.fit(X, y).predict(X_test)
+        assert predictions.shape == (30, 1)
+        np.testing.assert_allclose(predictions[:, 0], expected, atol=1e-10)
+
+def test_lowess_proxy_is_used_for_the_mse():
+    rng = np.random.default_rng(8)
+    dataset = rng.normal(size=(100, 3))
+    dataset[:, 0] = np.sin(3 * dataset[:, 1])
+    lowess = MutualInformationEstimator(proxy='LOWESS', proxy_params={'tau': 0.3})
+    ridge = MutualInformationEstimator()
+    assert lowess.estimate_original(dataset, 0, 1) > ridge.estimate_original(dataset, 0, 1)
+    assert np.allclose(lowess.estimate_original_batch(dataset, [(0, 1), (0, 1, [2])]),
+                       [lowess.estimate_original(dataset, 0, 1), lowess.estimate_original(dataset, 0, 1, [2])])
@@ -31,3 +31,124 @@ def test_compute_descriptors_with_dag(simple_dag_and_data):
     assert d2c_instance.x_y is not None
     # Further assertions to validate the structure and data of the descriptors
 
+
+
+def test_parallel_descriptors_match_sequential():
+    from d2c.data_generation.builder import TSBuilder
+    from d2c.descriptors.loader import DataLoader
+
+    tsbuilder = TSBuilder(observations_per_time_series=100, maxlags=2, n_variables=4, time_series_per_process=1, processes_to_use=[1, 9], seed=3, verbose=False)
+    tsbuilder.build()
+    dataloader = DataLoader(maxlags=2, n_variables=4)
+    dataloader.from_tsbuilder(tsbuilder)
+
+    descriptors = []
+    for n_jobs in [1, 2]:
+        d2c_instance = D2C(dags=dataloader.get_dags(), observations=dataloader.get_observations(), couples_to_consider_per_dag=6, MB_size=2, n_variables=4, maxlags=2, seed=0, n_jobs=n_jobs)
+        d2c_instance.initialize()
+        descriptors.append((d2c_instance.get_descriptors_df(), d2c_instance.get_test_couples()))
+
+    pd.testing.assert_frame_equal(descriptors[0][0], descriptors[1][0])
+    assert np.array_equal(descriptors[0][1], descriptors[1][1])
+
+
+def test_worker_copy_leaves_the_caches_behind():
+    observations = [np.random.RandomState(0).randn(60, 6)]
+    d2c_instance = D2C(dags=[nx.DiGraph()], observations=observations, MB_size=2, n_variables=2, maxlags=2, full=True)
+    d2c_instance.compute_descriptors_for_couple(0, 0, 1, 0)
+    assert d2c_instance.markov_blanket_estimator._ranked_dataset is not None
+    assert d2c_instance.mutual_information_estimator._ridge_mse is not None
+
+    worker_d2c = d2c_instance._worker_copy()
+    assert worker_d2c.observations is None
+    assert worker_d2c.markov_blanket_estimator._ranked_dataset is None
+    assert worker_d2c.markov_blanket_estimator._blankets is None
+    mutual_information_estimator = worker_d2c.mutual_information_estimator
+    assert mutual_information_estimator._ridge_mse is None
+    assert mutual_information_estimator._cmi_memo == {} and mutual_information_estimator._trees == {}
+    assert len(mutual_information_estimator.mse_cache.entries) == 0
+    # the parent keeps its own caches
+    assert d2c_instance.markov_blanket_estimator._ranked_dataset is not None
+    assert d2c_instance.mutual_information_estimator._ridge_mse is not None
+
+
+def test_series_context_matches_per_couple_computations():
+    from scipy.stats import kurtosis, skew
+    from d2c.descriptors.context import SeriesContext
+    from d2c.descriptors.utils import HOC
+
+    observations = np.random.randn(50, 6)
+    calls = []
+    def markov_blanket(data, node):
+        calls.append(node)
+        return [node + 1]
+
+    context = SeriesContext(observations, markov_blanket)
+    for c, e in [(0, 1), (3, 5)]:
+        for i, j in [(3, 1), (1, 2), (2, 1), (1, 3)]:
+            assert context.hoc(c, e, i, j) == HOC(observations[:, c], observations[:, e], i, j)
+        assert context.kurtosis[c] == kurtosis(observations[:, c])
+        assert context.skewness[e] == skew(observations[:, e])
+
+    assert context.markov_blanket(2) == [3]
+    assert context.markov_blanket(2) == [3]
+    assert calls == [2]
+
+
+def test_descriptor_matrix_follows_schema():
+    observations = np.random.randn(60, 12)
+    for full, quantiles in [(False, True), (True, False)]:
+        d2c_instance = D2C(dags=None, observations=[observations], MB_size=2, full=full, quantiles=quantiles)
+        df = d2c_instance.compute_descriptors_without_dag(3, 3)
+        # the columns only depend on the configuration, the values a couple does not have are NaN
+        assert list(df.columns) == d2c_instance.schema.columns
+        assert df["graph_id"].dtype == np.int64 and df["is_causal"].isna().all()
+        couple = d2c_instance.compute_descriptors_for_couple(0, int(df["edge_source"][0]), int(df["edge_dest"][0]), 1)
+        assert list(couple) == d2c_instance.schema.columns
+        assert couple["is_causal"] == 1
+        assert np.allclose([couple[c] for c in df.columns[4:]], df.iloc[0, 4:].to_numpy(dtype=float), equal_nan=True)
+
+    d2c_instance = D2C(dags=None, observations=[observations], MB_size=2, dtype=np.float32)
+    assert d2c_instance.compute_descriptors_without_dag(3, 3)["HOC_3_1"].dtype == np.float32
+    # float32 cannot tell the ids apart beyond 2**24
+    with pytest.raises(ValueError):
+        d2c_instance._compute_descriptors_for_couples([(2**24 + 1, 3, 0, 1)])
+    d2c_instance.schema.check_exact(np.float32, 2**24)
+    d2c_instance.schema.check_exact(np.float64, 2**24 + 1)
+
+
+def test_streamed_descriptors_resume(tmp_path):
+    import json
+    from d2c.data_generation.builder import TSBuilder
+    from d2c.descriptors.loader import DataLoader
+
+    tsbuilder = TSBuilder(observations_per_time_series=80, maxlags=2, n_variables=4, time_series_per_process=2, processes_to_use=[1, 9], seed=5, verbose=False)
+    tsbuilder.build()
+    dataloader = DataLoader(maxlags=2, n_variables=4)
+    dataloader.from_tsbuilder(tsbuilder)
+    kwargs = dict(dags=dataloader.get_dags(), observations=dataloader.get_observations(), couples_to_consider_per_dag=6, MB_size=2, n_variables=4, maxlags=2, seed=0)
+
+    d2c_instance = D2C(**kwargs)
+    d2c_instance.initialize()
+    expected = d2c_instance.get_descriptors_df()
+    expected_couples = [tuple(map(int, couple)) for couple in d2c_instance.get_test_couples()]
+
+    d2c_instance = D2C(output_dir=str(tmp_path), shard_size=5, **kwargs)
+    d2c_instance.initialize()
+    assert d2c_instance.x_y is None
+    pd.testing.assert_frame_equal(d2c_instance.get_descriptors_df(), expected)
+
+    # forget the last shard, as if the run had been interrupted before writing it
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert len(manifest["shards"]) > 1
+    manifest["shards"].pop()
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+
+    d2c_instance = D2C(output_dir=str(tmp_path), shard_size=5, **kwargs)
+    np.random.seed(1)  # the couples do not depend on the global random state
+    d2c_instance.initialize()
+    pd.testing.assert_frame_equal(d2c_instance.get_descriptors_df(), expected)
+    assert [tuple(map(int, couple)) for couple in d2c_instance.get_test_couples()] == expected_couples
+
+    with pytest.raises(ValueError):
+        D2C(output_dir=str(tmp_path), shard_size=5, **dict(kwargs, full=True)).initialize()
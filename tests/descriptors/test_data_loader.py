@@ -87,7 +87,19 @@ def test_create_lagged_multiple_ts():
     shapes = [obs.shape for obs in result]
     assert shapes == expected_shape
     assert np.array_equal(result[0],np.array([[5,6,3,4,1,2], [7,8,5,6,3,4]]))
- 
+
+
+def test_lagged_view():
+    obs = np.arange(12).reshape(6, 2)
+    lagged = DataLoader._lagged_view(obs, 2)
+    assert lagged.shape == (4, 3, 2)
+    assert np.shares_memory(lagged, obs)
+    assert np.array_equal(lagged.reshape(4, -1), DataLoader._create_lagged_single_ts(obs, 2))
+    assert np.array_equal(lagged[0], np.array([[4, 5], [2, 3], [0, 1]]))
+
+    # too short to have any row with all its lags
+    assert DataLoader._create_lagged_single_ts(obs[:2], 2).shape == (0, 6)
+
 # Mock TSBuilder for loading data test
 def test_from_tsbuilder(mocker):
     mocker.patch('d2c.data_generation.builder.TSBuilder', autospec=True)
@@ -153,4 +165,93 @@ def test_causal_df():
                 true_causal_dfs_copy = true_causal_dfs_copy.loc[~((true_causal_dfs_copy['from'] == edge_from) & 
                                     (true_causal_dfs_copy['to'] == edge_to))]
             
-        assert true_causal_dfs_copy.is_causal.sum() == 0
\ No newline at end of file
+        assert true_causal_dfs_copy.is_causal.sum() == 0
+
+def test_memmap_dataset_roundtrip(tmp_path):
+    tsbuilder = TSBuilder(observations_per_time_series=60, maxlags=3, n_variables=4, time_series_per_process=2, processes_to_use=[1, 17], max_neighborhood_size=2, seed=42, verbose=False)
+    tsbuilder.build()
+
+    dataloader = DataLoader(n_variables=4, maxlags=3)
+    dataloader.from_tsbuilder(tsbuilder)
+    dataloader.to_dataset(tmp_path)
+
+    memmap_loader = DataLoader(n_variables=4, maxlags=3)
+    memmap_loader.from_dataset(tmp_path)
+    assert len(memmap_loader.get_original_observations()) == 4
+    assert isinstance(memmap_loader.get_original_observations()[1], np.memmap)
+
+    for original, mapped in zip(dataloader.get_observations(), memmap_loader.get_observations()):
+        assert np.array_equal(original, mapped)
+    for original, mapped in zip(dataloader.dags, memmap_loader.dags):
+        assert list(original.nodes) == list(mapped.nodes)
+        assert list(original.edges) == list(mapped.edges)
+    true_causal_dfs = memmap_loader.get_true_causal_dfs()
+    for dag_idx, causal_df in dataloader.get_true_causal_dfs().items():
+        assert causal_df.equals(true_causal_dfs[dag_idx])
+
+
+def test_series_accessor_matches_getters():
+    tsbuilder = TSBuilder(observations_per_time_series=60, maxlags=3, n_variables=4, time_series_per_process=2, processes_to_use=[1, 17], max_neighborhood_size=2, seed=42, verbose=False)
+    tsbuilder.build()
+
+    dataloader = DataLoader(n_variables=4, maxlags=3, cache_size=2)
+    dataloader.from_tsbuilder(tsbuilder)
+    observations = dataloader.get_observations()
+    dags = dataloader.get_dags()
+    true_causal_dfs = dataloader.get_true_causal_dfs()
+
+    for index, (lagged, dag, causal_df) in enumerate(dataloader.iter_series()):
+        assert np.array_equal(lagged, observations[index])
+        assert list(dag.edges) == list(dags[index].edges)
+        assert causal_df.equals(true_causal_dfs[index])
+
+    # only the two most recently used series are kept
+    assert list(dataloader._series_cache.keys()) == [2, 3]
+    assert dataloader.get_series(3) is dataloader.get_series(3)
+    dataloader.get_series(0)
+    assert list(dataloader._series_cache.keys()) == [3, 0]
+
+
+def test_adjacency_tensor_and_long_causal_df():
+    dag = nx.DiGraph()
+    dag.add_edges_from([("0_t-1", "1_t-0"), ("1_t-2", "0_t-0"), ("0_t-2", "1_t-1")])
+    dataloader = DataLoader(n_variables=2, maxlags=2)
+    dataloader.dags = [dag, nx.DiGraph()]
+
+    adjacency = dataloader.get_adjacency_tensor()
+    assert adjacency.shape == (2, 6, 2)
+    # 0_t-1 is 2, 1_t-2 is 5; the edge between past variables is left out
+    assert sorted(zip(*np.nonzero(adjacency))) == [(0, 2, 1), (0, 5, 0)]
+
+    long_df = dataloader.get_true_causal_df_long()
+    true_causal_dfs = dataloader.get_true_causal_dfs()
+    assert list(long_df.columns) == ["graph_id", "from", "to", "effect", "p_value", "probability", "is_causal"]
+    for graph_id, causal_df in true_causal_dfs.items():
+        graph_rows = long_df[long_df.graph_id == graph_id].drop(columns="graph_id").reset_index(drop=True)
+        assert graph_rows.equals(causal_df)
+    assert true_causal_dfs[0].set_index(["from", "to"]).loc[(5, 0), "is_causal"] == 1
+    assert true_causal_dfs[1].is_causal.sum() == 0
+
+
+def test_causal_dfs_keep_the_edges_beyond_maxlags():
+    dag = nx.DiGraph()
+    dag.add_edges_from([("0_t-1", "1_t-0"), ("1_t-2", "0_t-0"), ("0_t-2", "1_t-1"), ("0_t-2", "1_t-0")])
+    # the DAG was built with two lags, the loader only looks one lag back
+    dataloader = DataLoader(n_variables=2, maxlags=1)
+    dataloader.dags = [nx.DiGraph(), dag]
+
+    assert dataloader.get_adjacency_tensor().shape == (2, 4, 2)
+    true_causal_dfs = dataloader.get_true_causal_dfs()
+    causal_df = true_causal_dfs[1]
+    # the pairs within maxlags, then the edges from beyond maxlags towards the present, in the order of the DAG
+    assert list(zip(causal_df["from"], causal_df.to, causal_df.is_causal)) == [
+        (2, 0, 0), (2, 1, 1), (3, 0, 0), (3, 1, 0), (5, 0, 1), (4, 1, 1)
+    ]
+    assert causal_df.is_causal.dtype == np.int64
+    assert len(true_causal_dfs[0]) == 4
+
+    long_df = dataloader.get_true_causal_df_long()
+    for graph_id, causal_df in true_causal_dfs.items():
+        graph_rows = long_df[long_df.graph_id == graph_id].drop(columns="graph_id").reset_index(drop=True)
+        assert graph_rows.equals(causal_df)
+    assert dataloader._true_causal_df(DataLoader._rename_dag(dag, 2)).equals(true_causal_dfs[1])